@@ -1,15 +1,23 @@
 from fastapi import FastAPI, Request, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import aiosqlite
 import os
+import re
+import csv
+import io
+import json
+import time
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
-from scripts.headers_extractor import GosuslugiExtractor
-from scripts.inspections_parser import GosuslugiInspectionsParser, load_to_sqlite
-import threading
-import asyncio
+import subprocess
+import sys
+from scripts.load_to_sqlite import SqliteLoader, date_to_epoch, OFFENCE_FOUND, OFFENCE_NOT_FOUND
+from scripts.db_pool import ReadConnectionPool
+from scripts.dataset_meta import DatasetMetaCache
+from scripts.response_cache import ResponseCache
+from scripts.metrics import web_registry, render_snapshot, gauge_snapshot
+from typing import Optional
+from datetime import date, datetime, timezone
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -18,6 +26,39 @@ logger = logging.getLogger(__name__)
 # Константы
 DB_NAME = 'data/inspections.db'
 PAGE_SIZE = 10
+# Запускать ли воркер загрузки (worker.py) отдельным процессом вместе с сервером;
+# False — воркер запускается отдельно: python worker.py
+EMBEDDED_WORKER = True
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')
+WORKER_STOP_TIMEOUT = 10  # Сколько секунд ждать завершения воркера при остановке сервера
+DB_POOL_SIZE = 4  # Кол-во соединений на чтение в пуле веб-приложения
+PAGE_CACHE_SIZE = 256  # Сколько готовых ответов (страниц, JSON) держать в LRU-кэше
+
+# Допустимые сортировки: параметр sort -> колонка БД (у каждой есть индекс (колонка, id))
+SORT_COLUMNS = {
+    'id': 'id',
+    'examStartDate': 'exam_start',
+    'entity_name': 'entity_name',
+}
+
+# Полнотекстовый поиск: ОГРН (13 цифр) и ОГРНИП (15 цифр) ищутся точным совпадением по индексу
+OGRN_LENGTHS = (13, 15)
+SEARCH_MAX_TERMS = 8  # Сколько слов запроса учитывать
+
+# Машиночитаемый доступ: /api/inspections (курсорная пагинация) и /export (потоковая выгрузка)
+API_COLUMNS = ('id', 'entity_name', 'ogrn', 'purpose', 'status', 'result', 'examStartDate')
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+EXPORT_CHUNK_SIZE = 1000  # Сколько строк читать из курсора и отдавать клиенту за раз
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'inspections.csv'),
+    'ndjson': ('application/x-ndjson', 'inspections.ndjson'),
+}
+
+# Сводки (/stats и блок на главной) читаются из таблиц, которые загрузчик обновляет при записи
+STATS_TOP_DEFAULT = 10
+STATS_TOP_MAX = 100
+SUMMARY_TOP = 5  # Сколько организаций показывать в сводке на главной
 
 # Создание приложения
 app = FastAPI()
@@ -32,93 +73,456 @@ templates = Jinja2Templates(directory="templates")
 if not os.path.exists('templates'):
     os.makedirs('templates')
 
-async def get_db_connection():
-    conn = await aiosqlite.connect(DB_NAME)
-    conn.row_factory = aiosqlite.Row
-    return conn
+# Общий пул соединений на чтение: открывается на старте, закрывается при остановке
+db_pool = ReadConnectionPool(DB_NAME, size=DB_POOL_SIZE)
+
+# Метаданные набора (число записей, версия, время загрузки) — вместо COUNT(*) на каждый запрос
+dataset_meta = DatasetMetaCache(db_pool)
+
+# ETag/Last-Modified по версии данных и кэш готовых ответов до следующей загрузки
+response_cache = ResponseCache(dataset_meta, maxsize=PAGE_CACHE_SIZE)
+
+@app.on_event("startup")
+async def open_db_pool():
+    await db_pool.open()
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await db_pool.close()
+
+REQUEST_SECONDS = web_registry.histogram(
+    'inspections_http_request_seconds', 'Время ответа по маршруту (до начала отправки тела)',
+    ('route', 'method', 'status'))
+
+@app.middleware("http")
+async def measure_request(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон маршрута ("/search"), а не фактический путь — чтобы не плодить метки
+    route = request.scope.get('route')
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route=getattr(route, 'path', 'unmatched'),
+                            method=request.method, status=response.status_code)
+    return response
+
+def keyset_segments(column: str, value, anchor_id: int, forward: bool):
+    """
+    Условия keyset-пагинации по (column, id) относительно якоря (value, anchor_id) в порядке обхода.
+    SQLite ставит NULL раньше любых значений, а сравнение с NULL ложно, поэтому записи без значения
+    (например, без даты начала) выбираются отдельным условием — и каждое идёт по индексу (column, id).
+    """
+    if column == 'id':
+        return [('id > ?' if forward else 'id < ?', [anchor_id])]
+    if forward:
+        if value is None:
+            return [(f'{column} IS NULL AND id > ?', [anchor_id]), (f'{column} IS NOT NULL', [])]
+        return [(f'({column}, id) > (?, ?)', [value, anchor_id])]
+    if value is None:
+        return [(f'{column} IS NULL AND id < ?', [anchor_id])]
+    return [(f'({column}, id) < (?, ?)', [value, anchor_id]), (f'{column} IS NULL', [])]
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, page: int = Query(1, ge=1)):
-    offset = (page - 1) * PAGE_SIZE
-    conn = await get_db_connection()
-    cursor = await conn.cursor()
-    
-    await cursor.execute('SELECT COUNT(*) FROM inspections')
-    total_row = await cursor.fetchone()
-    total = total_row[0]
-    total_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
-    
-    await cursor.execute('SELECT * FROM inspections ORDER BY id LIMIT ? OFFSET ?', (PAGE_SIZE, offset))
-    rows = await cursor.fetchall()
-    
-    await conn.close()
-    
+@response_cache.cached
+async def index(
+    request: Request,
+    page: int = Query(1, ge=1),
+    after: Optional[int] = Query(None),
+    before: Optional[int] = Query(None),
+    last: bool = Query(False),
+    sort: str = Query('id'),
+):
+    """
+    Keyset-пагинация: after/before — id последней/первой записи текущей страницы.
+    Позиция ищется по индексу (колонка сортировки, id), поэтому глубокие
+    страницы открываются так же быстро, как первая. page — только номер для отображения.
+    Если записи-якоря уже нет (удалена при обновлении, id сменились при полной перезагрузке),
+    показывается первая страница.
+    """
+    if sort not in SORT_COLUMNS:
+        sort = 'id'
+    column = SORT_COLUMNS[sort]
+    key = 'id' if column == 'id' else f'{column}, id'
+
+    meta = await dataset_meta.get()
+    total_pages = max(1, (meta["row_count"] + PAGE_SIZE - 1) // PAGE_SIZE)
+
+    async with db_pool.acquire() as conn:
+        cursor = await conn.cursor()
+
+        asc = f'ORDER BY {key.replace(", ", " ASC, ")} ASC'
+        desc = f'ORDER BY {key.replace(", ", " DESC, ")} DESC'
+        backwards = False
+        anchor_id = after if after is not None else before
+        anchor = None
+        if anchor_id is not None:
+            await cursor.execute(f'SELECT {column} FROM inspections WHERE id = ?', (anchor_id,))
+            anchor = await cursor.fetchone()
+            if anchor is None:
+                after = before = None
+                page = 1
+        if anchor is not None:
+            backwards = after is None
+            rows = []
+            for condition, params in keyset_segments(column, anchor[0], anchor_id, forward=not backwards):
+                await cursor.execute(f'SELECT * FROM inspections WHERE {condition} {desc if backwards else asc} LIMIT ?',
+                                     (*params, PAGE_SIZE + 1 - len(rows)))
+                rows.extend(await cursor.fetchall())
+                if len(rows) > PAGE_SIZE:
+                    break
+        else:
+            if last:
+                backwards = True
+                page = total_pages
+                await cursor.execute(f'SELECT * FROM inspections {desc} LIMIT ?', (PAGE_SIZE + 1,))
+            else:
+                # Прямой переход по номеру страницы (старые ссылки) — через OFFSET
+                offset = (page - 1) * PAGE_SIZE
+                await cursor.execute(f'SELECT * FROM inspections {asc} LIMIT ? OFFSET ?', (PAGE_SIZE + 1, offset))
+            rows = list(await cursor.fetchall())
+        await cursor.close()
+        stats = await load_stats(conn, top=SUMMARY_TOP)
+
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, not last
+    else:
+        has_prev, has_next = after is not None or page > 1, has_more
+    if not rows:
+        # Пустая страница (пустая БД или номер страницы за концом): ссылкам-курсорам не на что опираться
+        has_next = False
+    if not has_prev:
+        page = 1
+
     return templates.TemplateResponse("index.html", {
         "request": request,
         "rows": rows,
         "page": page,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "sort": sort,
+        "sort_options": list(SORT_COLUMNS),
+        "has_prev": has_prev,
+        "has_next": has_next,
+        "first_id": rows[0]["id"] if rows else None,
+        "last_id": rows[-1]["id"] if rows else None,
+        "stats": stats,
     })
 
-LAST_UPDATE_FILE = 'data/last_update.txt'
+def build_match_query(text: str) -> str:
+    """
+    Превращает ввод пользователя в запрос FTS5: каждое слово ищется как префикс,
+    все слова обязательны. Кавычки и операторы FTS5 из ввода не пропускаются.
+    """
+    terms = re.findall(r'\w+', text.lower())[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
 
-async def update_data_job():
-    logger.info('[SCHEDULER] Запуск функции update_data_job (диагностика)')
-    try:
-        logger.info('[SCHEDULER] Запуск автоматического обновления данных...')
-        extractor = GosuslugiExtractor(headless=True)
-        result = await extractor.run()
-        headers = result["headers"]
-        if not headers:
-            logger.warning('[SCHEDULER] Не удалось получить заголовки для обновления данных.')
-            return
-        parser = GosuslugiInspectionsParser(headers=headers)
-        data = parser.run()
-        if data:
-            load_to_sqlite(data, db_path=DB_NAME)
-            logger.info(f'[SCHEDULER] Данные успешно обновлены.')
-            # Сохраняем время последнего обновления
-            from datetime import datetime
-            with open(LAST_UPDATE_FILE, 'w', encoding='utf-8') as f:
-                f.write(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        else:
-            logger.warning('[SCHEDULER] Нет новых данных для обновления.')
-    except Exception as e:
-        logger.error(f'[SCHEDULER] Ошибка при обновлении данных: {e}')
+@app.get("/search", response_class=HTMLResponse)
+@response_cache.cached
+async def search(request: Request, q: str = Query('', max_length=200), page: int = Query(1, ge=1)):
+    """
+    Поиск по названию организации и цели проверки (FTS5, ранжирование bm25
+    с большим весом названия) или по ОГРН. Выдача постраничная, без подсчёта
+    общего числа совпадений: лишняя строка в LIMIT показывает, есть ли следующая страница.
+    """
+    query = q.strip()
+    offset = (page - 1) * PAGE_SIZE
+    if query.isdigit() and len(query) in OGRN_LENGTHS:
+        sql = 'SELECT * FROM inspections WHERE ogrn = ? ORDER BY id LIMIT ? OFFSET ?'
+        params = (query, PAGE_SIZE + 1, offset)
+    else:
+        match = build_match_query(query)
+        if not match:
+            return RedirectResponse('/')
+        sql = ('SELECT inspections.* FROM inspections_fts '
+               'JOIN inspections ON inspections.id = inspections_fts.rowid '
+               'WHERE inspections_fts MATCH ? ORDER BY bm25(inspections_fts, 10.0, 1.0) LIMIT ? OFFSET ?')
+        params = (match, PAGE_SIZE + 1, offset)
+
+    async with db_pool.acquire() as conn:
+        cursor = await conn.execute(sql, params)
+        rows = list(await cursor.fetchall())
+        await cursor.close()
+
+    return templates.TemplateResponse("index.html", {
+        "request": request,
+        "rows": rows[:PAGE_SIZE],
+        "page": page,
+        "query": query,
+        "has_prev": page > 1,
+        "has_next": len(rows) > PAGE_SIZE,
+    })
+
+def build_filters(status: Optional[str], result: Optional[str], ogrn: Optional[str],
+                  date_from: Optional[date], date_to: Optional[date]):
+    """
+    Условия WHERE для API и выгрузки. Статус сравнивается без суффикса
+    ". Изменено. Основание: ..." (status_name — имя из справочника), даты — по epoch-колонке exam_start.
+    По status_id, result_id и exam_start есть индексы.
+    """
+    conditions, params = [], []
+    if status:
+        conditions.append('status_name = ?')
+        params.append(status)
+    if result:
+        conditions.append('result = ?')
+        params.append(result)
+    if ogrn:
+        conditions.append('ogrn = ?')
+        params.append(ogrn)
+    if date_from:
+        conditions.append('exam_start >= ?')
+        params.append(date_to_epoch(date_from.isoformat()))
+    if date_to:
+        conditions.append('exam_start <= ?')
+        params.append(date_to_epoch(date_to.isoformat()))
+    return conditions, params
+
+@app.get('/api/inspections', response_class=JSONResponse)
+@response_cache.cached
+async def api_inspections(
+    request: Request,
+    status: Optional[str] = Query(None),
+    result: Optional[str] = Query(None),
+    ogrn: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    cursor: Optional[int] = Query(None, description='next_cursor из предыдущего ответа'),
+    limit: int = Query(API_DEFAULT_LIMIT, ge=1, le=API_MAX_LIMIT),
+):
+    """
+    Записи в порядке id с фильтрами. Пагинация курсором: next_cursor — id последней
+    записи страницы, передаётся в следующий запрос; null — записей больше нет.
+    """
+    conditions, params = build_filters(status, result, ogrn, date_from, date_to)
+    if cursor is not None:
+        conditions.append('id > ?')
+        params.append(cursor)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    async with db_pool.acquire() as conn:
+        db_cursor = await conn.execute(
+            f'SELECT {", ".join(API_COLUMNS)} FROM inspections {where} ORDER BY id LIMIT ?',
+            (*params, limit + 1)
+        )
+        rows = await db_cursor.fetchall()
+        await db_cursor.close()
+    items = [dict(row) for row in rows[:limit]]
+    return {
+        "items": items,
+        "next_cursor": items[-1]["id"] if len(rows) > limit else None,
+    }
+
+async def export_rows(sql: str, params: list, fmt: str):
+    """
+    Асинхронный генератор выгрузки: строки читаются из курсора порциями
+    по EXPORT_CHUNK_SIZE и сразу отдаются клиенту, весь результат в памяти не держится.
+    """
+    async with db_pool.dedicated() as conn:
+        cursor = await conn.execute(sql, params)
+        try:
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                # BOM — чтобы Excel открыл кириллицу в UTF-8 без настройки импорта
+                buffer.write('\ufeff')
+                writer.writerow(API_COLUMNS)
+            while True:
+                rows = await cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                    chunk = buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                else:
+                    chunk = ''.join(json.dumps(dict(row), ensure_ascii=False) + '\n' for row in rows)
+                yield chunk.encode('utf-8')
+            if fmt == 'csv' and buffer.tell():
+                # Пустая выгрузка — только заголовок
+                yield buffer.getvalue().encode('utf-8')
+        finally:
+            await cursor.close()
+
+@app.get('/export')
+@response_cache.conditional
+async def export(
+    request: Request,
+    format: str = Query('csv', pattern='^(csv|ndjson)$'),
+    status: Optional[str] = Query(None),
+    result: Optional[str] = Query(None),
+    ogrn: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+):
+    """Потоковая выгрузка CSV или NDJSON с теми же фильтрами, что и /api/inspections"""
+    conditions, params = build_filters(status, result, ogrn, date_from, date_to)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    sql = f'SELECT {", ".join(API_COLUMNS)} FROM inspections {where} ORDER BY id'
+    media_type, filename = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export_rows(sql, params, format), media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def violation_rate(offences: int, no_offences: int) -> Optional[float]:
+    """Доля проверок с нарушениями среди проверок с известным результатом"""
+    checked = offences + no_offences
+    return round(offences / checked, 4) if checked else None
+
+def org_stats(row) -> dict:
+    return {
+        "ogrn": row["ogrn"],
+        "entity_name": row["entity_name"],
+        "total": row["total"],
+        "offences": row["offences"],
+        "violation_rate": violation_rate(row["offences"], row["no_offences"]),
+    }
+
+async def load_stats(conn, ogrn: Optional[str] = None, date_from: Optional[date] = None,
+                     date_to: Optional[date] = None, top: int = STATS_TOP_DEFAULT) -> dict:
+    """
+    Сводка по таблицам inspections_daily и inspections_by_org: их размер зависит от числа
+    дней, статусов и организаций, а не от числа записей, поэтому деталь не сканируется.
+    Окно дат ограничивает распределения по дням; топ организаций — по всему набору.
+    """
+    conditions, params = [], []
+    if date_from:
+        conditions.append('d.day >= ?')
+        params.append(date_to_epoch(date_from.isoformat()))
+    if date_to:
+        conditions.append('d.day BETWEEN 0 AND ?')
+        params.append(date_to_epoch(date_to.isoformat()))
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    cursor = await conn.execute(
+        f'SELECT d.day, s.name AS status, r.name AS result, d.count FROM inspections_daily d '
+        f'JOIN inspections_statuses s ON s.id = d.status_id JOIN inspections_results r ON r.id = d.result_id '
+        f'{where} ORDER BY d.day', params
+    )
+    daily_rows = await cursor.fetchall()
+    await cursor.close()
+
+    by_status, by_result, days = {}, {}, {}
+    for row in daily_rows:
+        by_status[row["status"]] = by_status.get(row["status"], 0) + row["count"]
+        by_result[row["result"]] = by_result.get(row["result"], 0) + row["count"]
+        # День -1 — проверки без даты начала
+        day = days.setdefault(row["day"], {
+            "date": datetime.fromtimestamp(row["day"], tz=timezone.utc).date().isoformat() if row["day"] >= 0 else None,
+            "total": 0,
+            "by_status": {},
+        })
+        day["total"] += row["count"]
+        day["by_status"][row["status"]] = day["by_status"].get(row["status"], 0) + row["count"]
+    offences, no_offences = by_result.get(OFFENCE_FOUND, 0), by_result.get(OFFENCE_NOT_FOUND, 0)
+
+    cursor = await conn.execute(
+        'SELECT ogrn, entity_name, total, offences, no_offences FROM inspections_by_org '
+        'ORDER BY total DESC LIMIT ?', (top,)
+    )
+    top_rows = await cursor.fetchall()
+    await cursor.close()
+    organization = None
+    if ogrn:
+        cursor = await conn.execute(
+            'SELECT ogrn, entity_name, total, offences, no_offences FROM inspections_by_org WHERE ogrn = ?', (ogrn,)
+        )
+        org_row = await cursor.fetchone()
+        await cursor.close()
+        organization = org_stats(org_row) if org_row else None
+
+    return {
+        "total": sum(by_status.values()),
+        "offences": offences,
+        "no_offences": no_offences,
+        "violation_rate": violation_rate(offences, no_offences),
+        "by_status": dict(sorted(by_status.items(), key=lambda item: -item[1])),
+        "by_result": dict(sorted(by_result.items(), key=lambda item: -item[1])),
+        "daily": list(days.values()),
+        "top_organizations": [org_stats(row) for row in top_rows],
+        "organization": organization,
+    }
+
+@app.get('/stats', response_class=JSONResponse)
+@response_cache.cached
+async def stats(
+    request: Request,
+    ogrn: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    top: int = Query(STATS_TOP_DEFAULT, ge=1, le=STATS_TOP_MAX),
+):
+    """
+    Сводная статистика: всего проверок, доля нарушений, распределение по статусам
+    и результатам, по дням (с фильтром date_from/date_to), топ организаций по числу
+    проверок и, если задан ogrn, показатели одной организации.
+    """
+    async with db_pool.acquire() as conn:
+        return await load_stats(conn, ogrn=ogrn, date_from=date_from, date_to=date_to, top=top)
 
 @app.get('/last-update', response_class=JSONResponse)
-async def last_update():
-    import os
-    if os.path.exists(LAST_UPDATE_FILE):
-        with open(LAST_UPDATE_FILE, 'r', encoding='utf-8') as f:
-            ts = f.read().strip()
-        return {"last_update": ts}
+@response_cache.cached
+async def last_update(request: Request):
+    meta = await dataset_meta.get()
+    if meta["loaded_at"]:
+        return {
+            "last_update": meta["loaded_at"],
+            "version": meta["version"],
+            "row_count": meta["row_count"],
+            "status_counts": meta["status_counts"],
+        }
     else:
         return {"last_update": None, "message": "Данные ещё не обновлялись."}
 
-# Запуск планировщика в отдельном потоке
-
-def start_scheduler_in_thread():
-    def scheduler_thread():
-        scheduler = BackgroundScheduler()
-        def sync_update_job():
-            asyncio.run(update_data_job())
-        scheduler.add_job(sync_update_job, 'interval', minutes=10)
-        logger.info('[SCHEDULER] Планировщик запущен в отдельном потоке (диагностика)')
-        scheduler.start()
-        # Бесконечный цикл, чтобы поток не завершался
-        import time
-        while True:
-            time.sleep(60)
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus: веб-приложение (маршруты, БД, кэш ответов)
+    и последний запуск загрузки — его итог и срез метрик воркер сохраняет в ingest_runs.
+    """
+    async with db_pool.acquire() as conn:
+        cursor = await conn.execute(
+            'SELECT finished_at, duration_sec, mode, status, items, metrics FROM ingest_runs ORDER BY id DESC LIMIT 1'
+        )
+        run = await cursor.fetchone()
+        await cursor.close()
+    body = web_registry.render()
+    if run is not None:
+        families = {
+            'inspections_ingest_last_run_timestamp_seconds': gauge_snapshot(
+                'Время окончания последнего запуска загрузки (unix)',
+                datetime.fromisoformat(run["finished_at"]).timestamp()),
+            'inspections_ingest_last_run_duration_seconds': gauge_snapshot(
+                'Длительность последнего запуска загрузки', run["duration_sec"]),
+            'inspections_ingest_last_run_items': gauge_snapshot(
+                'Записей получено последним запуском загрузки', run["items"]),
+            'inspections_ingest_last_run_info': gauge_snapshot(
+                'Итог последнего запуска загрузки', 1, status=run["status"], mode=run["mode"] or ''),
+        }
+        families.update(json.loads(run["metrics"]))
+        body += render_snapshot(families)
+    return PlainTextResponse(body, media_type='text/plain; version=0.0.4; charset=utf-8')
 
-    thread = threading.Thread(target=scheduler_thread, daemon=True)
-    thread.start()
+# Таблица и индексы для keyset-пагинации должны существовать до первого запроса
+SqliteLoader(db_name=DB_NAME).ensure_schema()
 
-# --- Вызов обновления данных при старте сервера ---
-asyncio.run(update_data_job())
+def start_worker_process() -> subprocess.Popen:
+    """
+    Запускает воркер загрузки отдельным процессом (python worker.py): Playwright, запросы к API и
+    запись в БД не делят с веб-сервером ни GIL, ни event loop. Модуль worker импортируется только
+    в дочернем процессе, а тот не импортирует app.py. Новые данные веб-приложение видит по версии в dataset_meta.
+    """
+    process = subprocess.Popen([sys.executable, WORKER_SCRIPT], cwd=os.path.dirname(WORKER_SCRIPT))
+    logger.info(f'[SCHEDULER] Воркер загрузки запущен в отдельном процессе (pid {process.pid})')
+    return process
 
-# Запуск планировщика в отдельном потоке
-start_scheduler_in_thread()
+def stop_worker_process(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=WORKER_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
 
 def run_server():
     """
@@ -129,12 +533,14 @@ def run_server():
     import nest_asyncio
     import asyncio
 
+    worker_process = start_worker_process() if EMBEDDED_WORKER else None
+
     print("\nСервер запущен на http://localhost:5001\n")
     # Применяем патч, чтобы разрешить вложенные event loops
     nest_asyncio.apply()
 
     # Создаём конфиг и сервер
-    config = uvicorn.Config(app, host="localhost", port=5001, lifespan="off")
+    config = uvicorn.Config(app, host="localhost", port=5001, lifespan="on")
     server = uvicorn.Server(config)
 
     # Запускаем сервер
@@ -142,8 +548,9 @@ def run_server():
     try:
         loop.run_until_complete(server.serve())
     finally:
-        # scheduler.shutdown() # This line is now handled by the separate thread
-        pass # No need to shutdown here, as the scheduler runs in a separate thread
+        # Воркер останавливается вместе с сервером
+        if worker_process is not None:
+            stop_worker_process(worker_process)
     
 
 # Для запуска из терминала
@@ -0,0 +1,320 @@
+# benchmark.py — сквозной бенчмарк загрузки без обращения к dom.gosuslugi.ru
+#
+# Поднимает локальный scripts.fake_api и по очереди меряет:
+#   parser_*  — BaseAPIParser/ShardedInspectionsParser: страниц/с, записей/с (parser_stream — с stream_json)
+#   loader_*  — SqliteLoader (swap, upsert новых и неизменных): строк/с
+#   ingest    — шардированная выгрузка + upsert в SQLite целиком
+#   web       — задержка ответа "/" в app.py (keyset-страницы без кэша и повтор из кэша)
+# Каждый этап идёт в отдельном процессе, поэтому peak RSS относится только к нему.
+#
+# Запуск: python -m scripts.benchmark [--items 20000] [--json out.json] [--baseline old.json]
+# С --baseline сравнивает с сохранённым прогоном и завершается с кодом 1 при регрессии.
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from scripts.fake_api import FakeSearchAPI, make_items
+
+try:
+    import resource
+except ImportError:  # Windows: модуля resource нет, пиковый RSS не замеряется
+    resource = None
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Метрики, где больше — лучше; для остальных (задержки, память) лучше меньше
+HIGHER_IS_BETTER = ('pages_per_sec', 'items_per_sec', 'rows_per_sec')
+COMPARED_METRICS = HIGHER_IS_BETTER + ('p50_ms', 'p95_ms', 'cached_p50_ms')
+
+
+def window_of(config: Dict[str, Any]):
+    start = datetime.fromisoformat(config["start"]).replace(tzinfo=timezone.utc)
+    return start, start + timedelta(days=config["days"])
+
+
+def count_fetches(parser) -> List[int]:
+    """Подменяет fetch_page парсера счётчиком запрошенных страниц"""
+    counter = [0]
+    fetch_page = parser.fetch_page
+
+    def counted(page):
+        counter[0] += 1
+        return fetch_page(page)
+    parser.fetch_page = counted
+    return counter
+
+
+def bench_parser(config: Dict[str, Any], max_workers: int, stream_json: bool = False) -> Dict[str, Any]:
+    from scripts.inspections_parser import GosuslugiInspectionsParser
+    parser = GosuslugiInspectionsParser(
+        headers={}, window=window_of(config), api_url=config["url"], as_tuples=True,
+        max_workers=max_workers, stream_json=stream_json,
+        max_pages=config["items"] // GosuslugiInspectionsParser.page_size + 2
+    )
+    pages = count_fetches(parser)
+    started = time.perf_counter()
+    items = sum(len(batch) for batch in parser.iter_batches())
+    elapsed = time.perf_counter() - started
+    return {"pages": pages[0], "items": items, "seconds": elapsed,
+            "pages_per_sec": pages[0] / elapsed, "items_per_sec": items / elapsed}
+
+
+def bench_parser_serial(config):
+    return bench_parser(config, max_workers=1)
+
+
+def bench_parser_concurrent(config):
+    return bench_parser(config, max_workers=config["workers"])
+
+
+def bench_parser_stream(config):
+    return bench_parser(config, max_workers=config["workers"], stream_json=True)
+
+
+def bench_parser_sharded(config):
+    from scripts.inspections_parser import ShardedInspectionsParser
+    start, end = window_of(config)
+    parser = ShardedInspectionsParser(headers={}, start=start, end=end,
+                                      max_workers=config["workers"], api_url=config["url"])
+    started = time.perf_counter()
+    items = sum(len(batch) for batch in parser.iter_batches())
+    elapsed = time.perf_counter() - started
+    return {"items": items, "seconds": elapsed, "items_per_sec": items / elapsed}
+
+
+def loader_rows(config) -> List[tuple]:
+    from scripts.inspections_parser import GosuslugiInspectionsParser
+    parser = GosuslugiInspectionsParser(headers={})
+    return parser.transform_page(make_items(config["items"], days=config["days"]))
+
+
+def timed_load(load: Callable[[], int]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    rows = load()
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "seconds": elapsed, "rows_per_sec": rows / elapsed if elapsed else 0.0}
+
+
+def batched(rows: List[tuple], size: int = 1000):
+    return (rows[i:i + size] for i in range(0, len(rows), size))
+
+
+def bench_loader_swap(config):
+    from scripts.load_to_sqlite import SqliteLoader
+    rows = loader_rows(config)
+    loader = SqliteLoader(db_name=os.path.join(config["workdir"], 'swap.db'))
+    return timed_load(lambda: loader.swap_batches(batched(rows)))
+
+
+def bench_loader_upsert(config):
+    from scripts.load_to_sqlite import SqliteLoader
+    rows = loader_rows(config)
+    loader = SqliteLoader(db_name=os.path.join(config["workdir"], 'upsert.db'))
+    return timed_load(lambda: loader.upsert_batches(batched(rows)))
+
+
+def bench_loader_upsert_unchanged(config):
+    """Повторная загрузка тех же данных в БД этапа loader_upsert — инкрементальный прогон без изменений"""
+    from scripts.load_to_sqlite import SqliteLoader
+    rows = loader_rows(config)
+    loader = SqliteLoader(db_name=os.path.join(config["workdir"], 'upsert.db'))
+    return timed_load(lambda: loader.upsert_batches(batched(rows)))
+
+
+def bench_ingest(config):
+    from scripts.inspections_parser import ShardedInspectionsParser, stream_to_sqlite
+    start, end = window_of(config)
+    parser = ShardedInspectionsParser(headers={}, start=start, end=end, as_tuples=True,
+                                      max_workers=config["workers"], api_url=config["url"])
+    db_path = os.path.join(config["workdir"], 'ingest.db')
+    result = timed_load(lambda: stream_to_sqlite(parser.iter_batches(), db_path=db_path, mode='upsert',
+                                                 is_complete=lambda: parser.completed))
+    return {"items": result["rows"], "seconds": result["seconds"], "items_per_sec": result["rows_per_sec"]}
+
+
+def percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def bench_web(config):
+    """Задержка "/" в app.py на БД из этапа ingest (через TestClient, без сети)"""
+    site = os.path.join(config["workdir"], 'site')
+    os.makedirs(os.path.join(site, 'data'), exist_ok=True)
+    os.makedirs(os.path.join(site, 'static'), exist_ok=True)
+    shutil.copy(os.path.join(config["workdir"], 'ingest.db'), os.path.join(site, 'data', 'inspections.db'))
+    if not os.path.exists(os.path.join(site, 'templates')):
+        shutil.copytree(REPO_ROOT / 'templates', os.path.join(site, 'templates'))
+    os.chdir(site)
+    sys.path.insert(0, str(REPO_ROOT))
+
+    import app
+    from fastapi.testclient import TestClient
+
+    rnd = random.Random(1)
+    with TestClient(app.app) as client:
+        ids = [row["id"] for row in client.get('/api/inspections', params={"limit": 1000}).json()["items"]]
+        uncached = []
+        for _ in range(config["requests"]):
+            # Разные курсоры — разные ключи кэша ответов: каждый запрос идёт в БД и рендерит шаблон
+            url = f'/?sort={rnd.choice(list(app.SORT_COLUMNS))}&after={rnd.choice(ids)}'
+            started = time.perf_counter()
+            response = client.get(url)
+            uncached.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        cached = []
+        client.get('/')
+        for _ in range(config["requests"]):
+            started = time.perf_counter()
+            client.get('/')
+            cached.append(time.perf_counter() - started)
+    return {
+        "requests": config["requests"],
+        "p50_ms": percentile(uncached, 0.5) * 1000,
+        "p95_ms": percentile(uncached, 0.95) * 1000,
+        "cached_p50_ms": percentile(cached, 0.5) * 1000,
+    }
+
+
+STAGES = {
+    'parser_serial': bench_parser_serial,
+    'parser_concurrent': bench_parser_concurrent,
+    'parser_stream': bench_parser_stream,
+    'parser_sharded': bench_parser_sharded,
+    'loader_swap': bench_loader_swap,
+    'loader_upsert': bench_loader_upsert,
+    'loader_upsert_unchanged': bench_loader_upsert_unchanged,
+    'ingest': bench_ingest,
+    'web': bench_web,
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS текущего процесса, МБ; None — замер недоступен (Windows)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux — в килобайтах, в macOS — в байтах
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def stage_entry(name: str, config: Dict[str, Any], queue):
+    """Точка входа процесса этапа: выполняет его и добавляет пиковый RSS"""
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        # Загрузчик пишет прогресс через print — в отчёте бенчмарка он не нужен
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = STAGES[name](config)
+        peak = peak_rss_mb()
+        if peak is not None:
+            result["peak_rss_mb"] = peak
+        queue.put((name, result))
+    except Exception as e:
+        queue.put((name, {"error": f'{type(e).__name__}: {e}'}))
+
+
+def run_stage(name: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=stage_entry, args=(name, config, queue))
+    process.start()
+    _, result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Список регрессий: пропускная способность упала или задержка выросла больше чем на tolerance"""
+    regressions = []
+    for stage, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            old = baseline.get(stage, {}).get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f'{stage}.{metric}: {old:.1f} -> {new:.1f} ({change:+.0%})')
+    return regressions
+
+
+def print_report(results: Dict[str, Dict]):
+    columns = ('pages_per_sec', 'items_per_sec', 'rows_per_sec', 'p50_ms', 'p95_ms', 'cached_p50_ms', 'peak_rss_mb')
+    print(f"{'этап':<26}" + ''.join(f'{column:>15}' for column in columns))
+    for stage, metrics in results.items():
+        if "error" in metrics:
+            print(f'{stage:<26}  ошибка: {metrics["error"]}')
+            continue
+        cells = ''.join(f'{metrics[c]:>15.1f}' if c in metrics else f"{'-':>15}" for c in columns)
+        print(f'{stage:<26}{cells}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк парсера, загрузчика и веб-приложения на фейковом API')
+    parser.add_argument('--items', type=int, default=20000, help='записей в фейковом API')
+    parser.add_argument('--days', type=int, default=31, help='на сколько дней распределены записи')
+    parser.add_argument('--workers', type=int, default=4, help='параллельных запросов страниц')
+    parser.add_argument('--requests', type=int, default=200, help='запросов к "/" в этапе web')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа API, сек')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 5xx')
+    parser.add_argument('--stages', default=','.join(STAGES), help='этапы через запятую')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    parser.add_argument('--baseline', help='сравнить с сохранённым прогоном (--json)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение, доля')
+    args = parser.parse_args()
+
+    stages = [name for name in args.stages.split(',') if name]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f'неизвестные этапы: {", ".join(unknown)}')
+    if 'web' in stages and 'ingest' not in stages:
+        parser.error('этапу web нужна БД из этапа ingest')
+
+    workdir = tempfile.mkdtemp(prefix='inspections-bench-')
+    try:
+        with FakeSearchAPI(items_count=args.items, days=args.days, latency=args.latency,
+                           throttle_rate=args.throttle_rate, error_rate=args.error_rate) as api:
+            config = {
+                "url": api.url, "items": args.items, "days": args.days, "start": api.start.isoformat(),
+                "workers": args.workers, "requests": args.requests, "workdir": workdir,
+            }
+            results = {}
+            for name in stages:
+                print(f'[INFO] Этап {name}...', flush=True)
+                results[name] = run_stage(name, config)
+            print(f'[INFO] Фейковый API: {api.requests} запросов, ответы по статусам: {api.responses}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('[WARNING] Регрессии относительно базового прогона:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print('[INFO] Регрессий относительно базового прогона нет.')
+
+
+if __name__ == "__main__":
+    main()
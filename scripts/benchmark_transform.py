@@ -0,0 +1,102 @@
+# benchmark_transform.py — микро-бенчмарк разбора страницы ответа API
+#
+# Сравнивает пакетный разбор (GosuslugiInspectionsParser.transform_page) с прежней
+# поэлементной схемой (цепочки safe_get, status_map и strftime на каждый элемент).
+# Запуск: python -m scripts.benchmark_transform [кол-во элементов] [повторов]
+
+import sys
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from scripts.inspections_parser import GosuslugiInspectionsParser, compose_status
+from scripts.fake_api import make_items
+
+
+def legacy_process_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Прежняя поэлементная схема — эталон для сравнения"""
+    def safe_get(d, key, default=''):
+        return d[key] if isinstance(d, dict) and key in d else default
+
+    def format_status(item):
+        status = safe_get(item, 'status', '')
+        if status == "FINISHED":
+            return "Назначено" if safe_get(item, 'isAssigned', False) else "Завершено"
+        status_map = {"CANCELLED": "Отменена", "PLANNED": "Запланирована"}
+        result_status = status_map.get(status, status)
+        change_info = safe_get(item, 'examinationChangeInfo', {})
+        last_edit = safe_get(item, 'lastEditingDate', None)
+        reason = safe_get(safe_get(change_info, 'changingBase', {}), 'name', '')
+        last_edit_str = ''
+        if last_edit:
+            try:
+                last_edit_str = datetime.fromtimestamp(last_edit / 1000, tz=timezone.utc).strftime('%d.%m.%Y %H:%M')
+            except Exception:
+                last_edit_str = ''
+        if reason or last_edit_str:
+            result_status += f". Изменено. Основание: {reason} Последнее изменение: {last_edit_str}"
+        return result_status.strip()
+
+    def format_result(item):
+        examination_result = safe_get(item, 'examinationResult', {})
+        result = safe_get(examination_result, 'desc', '')
+        has_offence = safe_get(examination_result, 'hasOffence', None)
+        if has_offence is None:
+            has_offence = safe_get(item, 'hasOffence', None)
+        if has_offence is True:
+            return "Нарушения выявлены (в том числе факты невыполнения предписаний)"
+        elif has_offence is False:
+            return "Нарушений не выявлено"
+        return result
+
+    subject = safe_get(item, 'subject', {})
+    org_info = safe_get(subject, 'organizationInfoEnriched', {})
+    registry = safe_get(org_info, 'registryOrganizationCommonDetailWithNsi', {})
+    return {
+        'entity_name': safe_get(registry, 'shortName', ''),
+        'ogrn': safe_get(registry, 'ogrn', ''),
+        'purpose': safe_get(item, 'examObjective', ''),
+        'status': format_status(item),
+        'result': format_result(item),
+        'examStartDate': safe_get(item, 'from', ''),
+    }
+
+
+def best_time(func, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(count: int = 1000, repeats: int = 20):
+    logging.disable(logging.WARNING)
+    items = make_items(count)
+    parser = GosuslugiInspectionsParser(headers={})
+
+    # Результаты обеих схем должны совпадать (основание и время изменения пакетный разбор отдаёт отдельно)
+    legacy = [legacy_process_item(item) for item in items]
+    batched = []
+    for row in parser.transform_page(items):
+        fields = dict(zip(parser.output_fields, row))
+        fields["status"] = compose_status(fields.pop("status"), fields.pop("change_reason"), fields.pop("changed_at"))
+        del fields["external_id"]
+        batched.append(fields)
+    assert legacy == batched, "Пакетный разбор расходится с поэлементным"
+
+    legacy_time = best_time(lambda: [legacy_process_item(item) for item in items], repeats)
+    batch_time = best_time(lambda: parser.transform_page(items), repeats)
+    dict_time = best_time(lambda: parser.process_page(items), repeats)
+
+    print(f"Элементов на странице: {count}, повторов: {repeats} (лучшее время)")
+    print(f"  поэлементно (прежняя схема):  {legacy_time * 1000:8.2f} мс")
+    print(f"  transform_page (кортежи):     {batch_time * 1000:8.2f} мс  x{legacy_time / batch_time:.1f}")
+    print(f"  process_page (словари):       {dict_time * 1000:8.2f} мс  x{legacy_time / dict_time:.1f}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
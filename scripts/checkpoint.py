@@ -0,0 +1,161 @@
+import json
+import uuid
+import threading
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from scripts.load_to_sqlite import SqliteLoader
+
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """
+    Контрольные точки запуска загрузки в той же SQLite-базе: план запуска (окно поиска,
+    режим, changed_since) и по каждому запросу (ключ make_query_key — окно/подокно поиска)
+    номер последней страницы, записанной в БД, и признак завершения.
+    Ключи уже полученных записей копит загрузчик (SqliteLoader.staged_keys_table).
+
+    Прерванный запуск (сбой, перезапуск, остановка по ошибкам) продолжается следующим
+    с того же плана: завершённые запросы пропускаются, остальные идут со следующей страницы.
+    Открытым может быть только один запуск.
+    """
+
+    runs_table = 'ingest_checkpoints'
+    pages_table = 'ingest_checkpoint_pages'
+
+    def __init__(self, loader: SqliteLoader, run_id: str, plan: Dict[str, Any],
+                 started_at: str, pages: Optional[Dict[str, Tuple[int, bool]]] = None):
+        self.loader = loader
+        self.run_id = run_id
+        self.plan = plan
+        self.started_at = started_at
+        # query_key -> (последняя записанная страница, запрос завершён)
+        self.pages = pages or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create_tables(cls, conn):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {cls.runs_table} (
+            run_id TEXT PRIMARY KEY,
+            plan TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )''')
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {cls.pages_table} (
+            run_id TEXT NOT NULL,
+            query_key TEXT NOT NULL,
+            last_page INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_id, query_key)
+        ) WITHOUT ROWID''')
+
+    @staticmethod
+    def encode_plan(plan: Dict[str, Any]) -> str:
+        return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                           for key, value in plan.items()})
+
+    @staticmethod
+    def decode_plan(raw: str) -> Dict[str, Any]:
+        plan = json.loads(raw)
+        for key in ('start', 'end'):
+            plan[key] = datetime.fromisoformat(plan[key])
+        return plan
+
+    @classmethod
+    def discard_all(cls, loader: SqliteLoader, conn):
+        conn.execute(f'DELETE FROM {cls.pages_table}')
+        conn.execute(f'DELETE FROM {cls.runs_table}')
+        loader.clear_staged_keys(conn)
+
+    @classmethod
+    def resume(cls, db_name: str, max_age: timedelta) -> Optional['RunCheckpoint']:
+        """Незавершённый запуск, если он есть и начат не раньше max_age назад; устаревший отбрасывается"""
+        loader = SqliteLoader(db_name=db_name)
+        conn = loader.connect()
+        try:
+            cls.create_tables(conn)
+            row = conn.execute(
+                f'SELECT run_id, plan, started_at FROM {cls.runs_table} ORDER BY started_at DESC LIMIT 1'
+            ).fetchone()
+            if row is None:
+                return None
+            run_id, raw_plan, started_at = row
+            if datetime.now(timezone.utc) - datetime.fromisoformat(started_at) > max_age:
+                logger.info(f"Контрольная точка запуска {run_id} устарела (начат {started_at}), начинаем заново")
+                cls.discard_all(loader, conn)
+                conn.commit()
+                return None
+            pages = {key: (last_page, bool(done)) for key, last_page, done in conn.execute(
+                f'SELECT query_key, last_page, done FROM {cls.pages_table} WHERE run_id = ?', (run_id,)
+            )}
+            return cls(loader, run_id, cls.decode_plan(raw_plan), started_at, pages)
+        finally:
+            conn.close()
+
+    @classmethod
+    def start(cls, db_name: str, plan: Dict[str, Any]) -> 'RunCheckpoint':
+        """Открывает новый запуск с планом plan (прежние незавершённые запуски отбрасываются)"""
+        loader = SqliteLoader(db_name=db_name)
+        run_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc).isoformat()
+        conn = loader.connect()
+        try:
+            cls.create_tables(conn)
+            cls.discard_all(loader, conn)
+            conn.execute(
+                f'INSERT INTO {cls.runs_table} (run_id, plan, started_at, updated_at) VALUES (?, ?, ?, ?)',
+                (run_id, cls.encode_plan(plan), now, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return cls(loader, run_id, plan, now)
+
+    def next_page(self, query_key: str) -> int:
+        """Страница, с которой продолжать запрос (1 — запрос ещё не начинался)"""
+        with self._lock:
+            return self.pages.get(query_key, (0, False))[0] + 1
+
+    def is_done(self, query_key: str) -> bool:
+        with self._lock:
+            return self.pages.get(query_key, (0, False))[1]
+
+    @property
+    def resumed_pages(self) -> int:
+        with self._lock:
+            return sum(last_page for last_page, _ in self.pages.values())
+
+    def commit_page(self, query_key: str, page: int, done: bool = False):
+        """
+        Отмечает страницу page запроса записанной в БД (done — запрос выгружен до конца).
+        Вызывается после того, как загрузчик закоммитил пачку этой страницы.
+        """
+        with self._lock:
+            last_page = max(page, self.pages.get(query_key, (0, False))[0])
+            self.pages[query_key] = (last_page, done)
+            conn = self.loader.connect()
+            try:
+                conn.execute(
+                    f'INSERT INTO {self.pages_table} (run_id, query_key, last_page, done) VALUES (?, ?, ?, ?) '
+                    f'ON CONFLICT(run_id, query_key) DO UPDATE SET last_page = excluded.last_page, done = excluded.done',
+                    (self.run_id, query_key, last_page, int(done))
+                )
+                conn.execute(f'UPDATE {self.runs_table} SET updated_at = ? WHERE run_id = ?',
+                             (datetime.now(timezone.utc).isoformat(), self.run_id))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def finish(self):
+        """Запуск завершён — контрольные точки и накопленные ключи больше не нужны"""
+        with self._lock:
+            conn = self.loader.connect()
+            try:
+                self.create_tables(conn)
+                self.discard_all(self.loader, conn)
+                conn.commit()
+            finally:
+                conn.close()
+            self.pages = {}
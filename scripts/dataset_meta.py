@@ -0,0 +1,57 @@
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetMetaCache:
+    """
+    Кэш метаданных набора данных (таблица dataset_meta) внутри процесса.
+    Пока версия в БД не меняется, маршруты получают метаданные без запросов;
+    версия перепроверяется не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, pool, check_interval: float = 5.0):
+        self.pool = pool
+        self.check_interval = check_interval
+        self._meta: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Сбрасывает кэш (например, сразу после загрузки новых данных)"""
+        self._meta = None
+
+    async def get(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self._meta is not None and now - self._checked_at < self.check_interval:
+            return self._meta
+
+        async with self.pool.acquire() as conn:
+            if self._meta is not None:
+                async with conn.execute('SELECT version FROM dataset_meta WHERE id = 1') as cursor:
+                    row = await cursor.fetchone()
+                if row is not None and row[0] == self._meta["version"]:
+                    self._checked_at = now
+                    return self._meta
+
+            async with conn.execute(
+                'SELECT version, row_count, loaded_at, status_counts FROM dataset_meta WHERE id = 1'
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if row is None:
+            meta = {"version": 0, "row_count": 0, "loaded_at": None, "status_counts": {}}
+        else:
+            meta = {
+                "version": row["version"],
+                "row_count": row["row_count"],
+                "loaded_at": row["loaded_at"],
+                "status_counts": json.loads(row["status_counts"]),
+            }
+        if self._meta is None or self._meta["version"] != meta["version"]:
+            logger.info(f"Метаданные набора обновлены: версия {meta['version']}, записей {meta['row_count']}")
+        self._meta = meta
+        self._checked_at = now
+        return meta
@@ -0,0 +1,96 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aiosqlite
+
+from scripts.metrics import web_registry
+
+POOL_WAIT_SECONDS = web_registry.histogram(
+    'inspections_db_pool_wait_seconds', 'Ожидание свободного соединения пула')
+DB_QUERY_SECONDS = web_registry.histogram(
+    'inspections_db_query_seconds', 'Время работы с соединением пула (запросы и выборка)')
+
+logger = logging.getLogger(__name__)
+
+
+class ReadConnectionPool:
+    """
+    Пул долгоживущих aiosqlite-соединений только для чтения.
+    Создаётся один раз на старте приложения и переиспользуется всеми маршрутами,
+    чтобы не открывать файл БД и не запускать новый поток на каждый запрос.
+    """
+
+    def __init__(self, db_name: str, size: int = 4, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kb: int = 64 * 1024):
+        self.db_name = db_name
+        self.size = size
+        self.pragmas = [
+            f'PRAGMA mmap_size={mmap_size}',
+            f'PRAGMA cache_size=-{cache_size_kb}',  # отрицательное значение — в килобайтах
+            'PRAGMA query_only=ON',
+            'PRAGMA temp_store=MEMORY',
+        ]
+        self._queue: Optional[asyncio.Queue] = None
+        self._connections = []
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_name)
+        conn.row_factory = aiosqlite.Row
+        for pragma in self.pragmas:
+            await conn.execute(pragma)
+        return conn
+
+    async def open(self):
+        """Открывает соединения пула (повторный вызов ничего не делает)"""
+        async with self._lock:
+            if self._queue is not None:
+                return
+            queue = asyncio.Queue()
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._connections.append(conn)
+                queue.put_nowait(conn)
+            self._queue = queue
+            logger.info(f"Открыт пул соединений к {self.db_name} ({self.size} шт.)")
+
+    async def close(self):
+        """Закрывает все соединения пула"""
+        async with self._lock:
+            for conn in self._connections:
+                await conn.close()
+            self._connections = []
+            self._queue = None
+            logger.info("Пул соединений закрыт")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Выдаёт соединение из пула и возвращает его обратно после использования"""
+        if self._queue is None:
+            # Без lifespan-событий (например, lifespan="off") пул открывается при первом запросе
+            await self.open()
+        queue = self._queue
+        started = time.perf_counter()
+        conn = await queue.get()
+        acquired = time.perf_counter()
+        POOL_WAIT_SECONDS.observe(acquired - started)
+        try:
+            yield conn
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - acquired)
+            queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def dedicated(self):
+        """
+        Отдельное соединение с теми же настройками, но вне пула — для долгих
+        потоковых выгрузок, чтобы они не занимали соединения обычных запросов
+        """
+        conn = await self._connect()
+        try:
+            yield conn
+        finally:
+            await conn.close()
@@ -0,0 +1,220 @@
+# fake_api.py — локальная замена API examinations/public/search для бенчмарков и отладки
+#
+# Говорит на том же протоколе, что и dom.gosuslugi.ru: POST с параметрами page/itemsPerPage
+# и телом с окном examStartFrom/examStartTo, ответ {"items": [...], "total": N}.
+# Умеет добавлять задержку, 429 (с Retry-After) и 5xx с заданной вероятностью.
+# Запуск отдельно: python -m scripts.fake_api --items 100000 --port 8765
+
+import json
+import random
+import argparse
+import bisect
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PATH = '/inspection/api/rest/services/examinations/public/search'
+
+
+def make_item(rnd: random.Random, index: int, day: date) -> Dict[str, Any]:
+    """Элемент, похожий на ответ examinations/public/search"""
+    day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    item = {
+        "guid": f"00000000-0000-0000-0000-{index:012d}",
+        "status": rnd.choice(["FINISHED", "FINISHED", "PLANNED", "CANCELED"]),
+        "isAssigned": rnd.random() < 0.3,
+        "examObjective": f"Проверка доводов обращения № {rnd.randint(1, 99999)}",
+        "from": day.strftime('%d.%m.%Y'),
+        "lastEditingDate": int(day_start.timestamp() * 1000) + rnd.randint(0, 24 * 3600 * 1000 - 1),
+        "subject": {
+            "organizationInfoEnriched": {
+                "registryOrganizationCommonDetailWithNsi": {
+                    "shortName": f"ООО УК \"ПРИМЕР-{rnd.randint(1, 500)}\"",
+                    "ogrn": str(1020000000000 + rnd.randint(0, 10 ** 9)),
+                    "inn": str(rnd.randint(10 ** 9, 10 ** 10)),
+                }
+            }
+        },
+        "examinationResult": rnd.choice([
+            {"hasOffence": True, "desc": "Выявлены"},
+            {"hasOffence": False, "desc": "Не выявлены"},
+            {},
+        ]),
+    }
+    if rnd.random() < 0.2:
+        item["examinationChangeInfo"] = {"changingBase": {"name": "Решение руководителя"}}
+    return item
+
+
+def make_items(count: int, start: date = date(2025, 7, 1), days: int = 31, seed: int = 42) -> List[Dict[str, Any]]:
+    """count элементов, равномерно распределённых по дням [start, start + days), в порядке дат"""
+    rnd = random.Random(seed)
+    return [make_item(rnd, i, start + timedelta(days=i * days // count)) for i in range(count)]
+
+
+def parse_api_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+
+class FakeSearchAPI:
+    """
+    HTTP-сервер с набором из items_count сгенерированных проверок.
+    Элементы сериализуются один раз при старте; ответ на страницу — склейка готовых байтов,
+    поэтому сервер не становится узким местом при замерах парсера.
+
+    latency — базовая задержка ответа в секундах (плюс случайная до latency_jitter),
+    throttle_rate / error_rate — доля ответов 429 (с Retry-After) и 500/502/503.
+    """
+
+    def __init__(self, items_count: int = 20000, start: date = date(2025, 7, 1), days: int = 31,
+                 host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, retry_after: int = 1, seed: int = 42):
+        self.start = start
+        self.days = days
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rnd = random.Random(seed)
+        self.rnd_lock = threading.Lock()
+        self.requests = 0
+        self.responses = {}  # статус -> кол-во
+
+        items = make_items(items_count, start=start, days=days, seed=seed)
+        # Время начала каждого элемента (полночь дня "from", UTC) — для отбора по окну бинарным поиском
+        self.item_starts = [
+            datetime.strptime(item["from"], '%d.%m.%Y').replace(tzinfo=timezone.utc) for item in items
+        ]
+        self.encoded = [json.dumps(item, ensure_ascii=False).encode('utf-8') for item in items]
+
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{SEARCH_PATH}'
+
+    def window_range(self, payload: Dict[str, Any]):
+        """Индексы [lo, hi) элементов, чья дата начала попадает в окно запроса (включительно)"""
+        start = parse_api_datetime(payload.get("examStartFrom"))
+        end = parse_api_datetime(payload.get("examStartTo"))
+        lo = bisect.bisect_left(self.item_starts, start) if start else 0
+        hi = bisect.bisect_right(self.item_starts, end) if end else len(self.item_starts)
+        return lo, max(lo, hi)
+
+    def pick_fault(self) -> Optional[int]:
+        with self.rnd_lock:
+            roll = self.rnd.random()
+            if roll < self.throttle_rate:
+                return 429
+            if roll < self.throttle_rate + self.error_rate:
+                return self.rnd.choice([500, 502, 503])
+            return None
+
+    def delay(self) -> float:
+        with self.rnd_lock:
+            return self.latency + self.rnd.uniform(0, self.latency_jitter)
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, как у настоящего API: парсер переиспользует соединения сессии
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+            def send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                api.responses[status] = api.responses.get(status, 0) + 1
+
+            def do_POST(self):
+                api.requests += 1
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                parts = urlsplit(self.path)
+                if parts.path != SEARCH_PATH:
+                    return self.send(404, b'{"error": "not found"}')
+
+                wait = api.delay()
+                if wait:
+                    threading.Event().wait(wait)
+                fault = api.pick_fault()
+                if fault == 429:
+                    return self.send(429, b'{"error": "too many requests"}', {'Retry-After': str(api.retry_after)})
+                if fault:
+                    return self.send(fault, b'{"error": "server error"}')
+
+                try:
+                    payload = json.loads(body or b'{}')
+                    query = parse_qs(parts.query)
+                    page = int(query.get('page', ['1'])[0])
+                    per_page = int(query.get('itemsPerPage', ['1000'])[0])
+                except ValueError:
+                    return self.send(400, b'{"error": "bad request"}')
+
+                lo, hi = api.window_range(payload)
+                first = lo + (page - 1) * per_page
+                chunk = api.encoded[first:min(first + per_page, hi)] if first < hi else []
+                self.send(200, b'{"items": [' + b','.join(chunk) + b'], "total": ' + str(hi - lo).encode() + b'}')
+
+        return Handler
+
+    def start_background(self) -> 'FakeSearchAPI':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-api', daemon=True)
+        self.thread.start()
+        logger.info(f"Фейковый API запущен: {self.url} ({len(self.encoded)} записей)")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start_background()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный фейковый API examinations/public/search')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, сек')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 5xx')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    api = FakeSearchAPI(items_count=args.items, days=args.days, port=args.port, latency=args.latency,
+                        latency_jitter=args.jitter, throttle_rate=args.throttle_rate, error_rate=args.error_rate)
+    logger.info(f"Фейковый API: {api.url} ({args.items} записей), Ctrl+C для остановки")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
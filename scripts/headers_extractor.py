@@ -6,6 +6,8 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 import sys
 import os
+import time
+import asyncio
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -18,12 +20,24 @@ class BaseExtractor(ABC):
     Реализует общую структуру: запуск браузера, навигация, перехват запросов.
     """
 
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, keep_browser: bool = False, lightweight: bool = False,
+                 capture_timeout: int = 15000):
         self.headless = headless
+        # keep_browser=True — браузер и контекст остаются открытыми между запусками (тёплый старт)
+        self.keep_browser = keep_browser
+        # lightweight=True — не грузим картинки, шрифты, стили, медиа и сторонние трекеры
+        self.lightweight = lightweight
+        self.capture_timeout = capture_timeout
+        self._captured_event = None
         self.browser = None
         self.context = None
         self.page = None
-        self.captured_data = {
+        self._loop = None
+        self.captured_data = self.empty_capture()
+
+    @staticmethod
+    def empty_capture() -> Dict[str, Any]:
+        return {
             "url": None,
             "headers": None,
             "body": None
@@ -44,8 +58,24 @@ class BaseExtractor(ABC):
         """Определяет, как навигировать и запустить нужный запрос"""
         pass
 
+    def get_blocked_resource_types(self) -> set:
+        """Типы ресурсов, которые в облегчённом режиме не загружаются"""
+        return {"image", "font", "stylesheet", "media", "texttrack", "eventsource", "manifest"}
+
+    def get_blocked_host_keywords(self) -> list:
+        """Фрагменты адресов сторонних сервисов (аналитика, карты, виджеты), блокируемых в облегчённом режиме"""
+        return [
+            "mc.yandex", "metrika", "google-analytics", "googletagmanager", "doubleclick",
+            "api-maps.yandex", "top-fwz1.mail.ru", "sputnik", "counter", "vk.com/rtrg",
+        ]
+
     async def setup_browser(self):
-        """Запускает браузер и создаёт контекст"""
+        """Запускает браузер и создаёт контекст (или переиспользует уже открытый)"""
+        if self.browser is not None and self._loop is asyncio.get_running_loop() and self.browser.is_connected():
+            self.page = await self.context.new_page()
+            logger.info("🌐 Используется уже запущенный браузер")
+            return
+        self._loop = asyncio.get_running_loop()
         self.playwright = await async_playwright().start()
         self.browser = await self.playwright.chromium.launch(headless=self.headless)
         self.context = await self.browser.new_context(
@@ -60,18 +90,48 @@ class BaseExtractor(ABC):
 
     async def setup_route_handler(self):
         """Настраивает перехват сетевых запросов"""
+        # Списки приводятся к нижнему регистру один раз, а не на каждый запрос
+        keywords = tuple(k.lower() for k in self.get_target_keywords())
+        blocked_types = frozenset(self.get_blocked_resource_types()) if self.lightweight else frozenset()
+        blocked_hosts = tuple(k.lower() for k in self.get_blocked_host_keywords()) if self.lightweight else ()
+        self._captured_event = asyncio.Event()
+
         async def handle_route(route, request):
             url = request.url.lower()
-            keywords = [k.lower() for k in self.get_target_keywords()]
-            if any(keyword in url for keyword in keywords) and request.method == "POST":
+            if request.method == "POST" and any(keyword in url for keyword in keywords):
                 logger.info(f"🎯 Перехвачен целевой запрос: {request.url}")
                 self.captured_data["url"] = request.url
                 self.captured_data["headers"] = dict(request.headers)
-                self.captured_data["body"] = await request.post_data()
+                self.captured_data["body"] = request.post_data
+                self._captured_event.set()
+            elif request.resource_type in blocked_types or any(host in url for host in blocked_hosts):
+                await route.abort()
+                return
             await route.continue_()
 
         await self.page.route("**/*", handle_route)
-        logger.info("🔧 Настроен перехват запросов")
+        logger.info(f"🔧 Настроен перехват запросов{' (облегчённый режим)' if self.lightweight else ''}")
+
+    async def wait_for_capture(self, timeout: int = None):
+        """Ждёт перехвата целевого запроса — ответ API для получения заголовков не нужен"""
+        timeout = timeout or self.capture_timeout
+        try:
+            await asyncio.wait_for(self._captured_event.wait(), timeout=timeout / 1000)
+            logger.info("✅ Целевой запрос перехвачен")
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Не удалось дождаться целевого запроса")
+
+    async def capture_cookies(self):
+        """
+        Дополняет перехваченные заголовки cookie из контекста браузера, если их нет в запросе.
+        Берутся только cookie адреса API: остальные (сторонние сайты, счётчики) в API не отправляются.
+        """
+        headers = self.captured_data["headers"]
+        if not headers or not self.captured_data["url"] or any(k.lower() == "cookie" for k in headers):
+            return
+        cookies = await self.context.cookies([self.captured_data["url"]])
+        if cookies:
+            headers["cookie"] = "; ".join(f"{c['name']}={c['value']}" for c in cookies)
 
     async def wait_for_api_response(self, timeout: int = 15000):
         """Ожидает ответа от API"""
@@ -88,17 +148,28 @@ class BaseExtractor(ABC):
             logger.warning("⚠️ Не удалось дождаться ответа от API")
 
     async def close(self):
-        """Закрывает браузер"""
+        """Закрывает страницу, а без keep_browser — и весь браузер"""
+        if self.keep_browser and self.browser is not None:
+            if self.page is not None:
+                await self.page.close()
+                self.page = None
+            return
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Закрывает браузер независимо от keep_browser"""
         if self.browser:
             await self.browser.close()
             logger.info("🛑 Браузер закрыт")
-        if hasattr(self, 'playwright'):
+        if getattr(self, 'playwright', None):
             await self.playwright.stop()
+        self.playwright = self.browser = self.context = self.page = None
 
     async def run(self) -> Dict[str, Any]:
         """
         Основной метод — шаблонный алгоритм (Template Method)
         """
+        self.captured_data = self.empty_capture()
         try:
             await self.setup_browser()
             await self.setup_route_handler()
@@ -108,8 +179,9 @@ class BaseExtractor(ABC):
 
             await self.navigate_and_trigger()
 
-            await self.wait_for_api_response()
+            await self.wait_for_capture()
 
+            await self.capture_cookies()
             return self.captured_data
 
         except Exception as e:
@@ -119,6 +191,44 @@ class BaseExtractor(ABC):
             await self.close()
 
 
+class CredentialCache:
+    """
+    Кэш перехваченных заголовков (session-guid, state-guid, cookie) с TTL.
+    Браузер запускается только когда кэш пуст, устарел или сброшен
+    через invalidate() после ошибки авторизации у парсера.
+    """
+
+    def __init__(self, extractor: BaseExtractor, ttl: float = 3600):
+        self.extractor = extractor
+        self.ttl = ttl
+        self._headers: Optional[Dict[str, str]] = None
+        self._captured_at = 0.0
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._headers is not None and time.monotonic() - self._captured_at < self.ttl
+
+    def invalidate(self):
+        """Сбрасывает кэш — следующий get_headers() заново извлечёт заголовки"""
+        if self._headers is not None:
+            logger.info("♻️ Кэш заголовков сброшен")
+        self._headers = None
+
+    async def get_headers(self) -> Optional[Dict[str, str]]:
+        if self.is_fresh:
+            age = int(time.monotonic() - self._captured_at)
+            logger.info(f"🔐 Используются закэшированные заголовки (возраст {age} сек)")
+            return self._headers
+        result = await self.extractor.run()
+        if result["headers"]:
+            self._headers = result["headers"]
+            self._captured_at = time.monotonic()
+        return result["headers"]
+
+    async def close(self):
+        await self.extractor.shutdown()
+
+
 class GosuslugiExtractor(BaseExtractor):
     """
     Конкретная реализация для https://dom.gosuslugi.ru 
@@ -5,16 +5,59 @@ import json
 import time
 import uuid
 import random
-from datetime import datetime, timezone
+import threading
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Callable, Tuple
 
 # Настройка логгирования
 import logging
 logger = logging.getLogger(__name__)
 
-from scripts.load_to_sqlite import SqliteLoader
+from scripts.load_to_sqlite import SqliteLoader, OFFENCE_FOUND, OFFENCE_NOT_FOUND
+from scripts.page_archive import PageArchiveWriter, make_query_key, read_archive
+from scripts.metrics import ingest_registry
+from scripts.rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from scripts.checkpoint import RunCheckpoint
+from scripts.json_stream import iter_object_items, make_projector
+
+# Метрики загрузки: срез сохраняется вместе с итогом каждого запуска (см. worker.py)
+FETCH_SECONDS = ingest_registry.histogram(
+    'inspections_fetch_page_seconds', 'Длительность одной попытки запроса страницы к API', ('status',))
+FETCH_RETRIES = ingest_registry.counter(
+    'inspections_fetch_retries_total', 'Повторные попытки запроса страницы по причине', ('reason',))
+PAGES_TOTAL = ingest_registry.counter(
+    'inspections_pages_total', 'Запросы страниц по итогу (ok, failed, auth_failed)', ('outcome',))
+ITEMS_PROCESSED = ingest_registry.counter(
+    'inspections_items_processed_total', 'Разобранные элементы ответа API')
+ITEMS_SKIPPED = ingest_registry.counter(
+    'inspections_items_skipped_total', 'Пропущенные элементы по причине (not_dict, unchanged)', ('reason',))
+ITEM_FAILURES = ingest_registry.counter(
+    'inspections_item_failures_total', 'Ошибки разбора элементов (process_item / build_row)')
+PAGES_REQUEUED = ingest_registry.counter(
+    'inspections_pages_requeued_total', 'Страницы, не полученные после всех попыток и поставленные в очередь повторно')
+
+STREAM_CHUNK_SIZE = 64 * 1024  # Размер куска тела ответа при потоковом разборе JSON
+
+
+def create_http_session(pool_size: int = 10, keep_alive: bool = True) -> requests.Session:
+    """
+    Создаёт HTTP-сессию с пулом keep-alive соединений.
+    Одну сессию можно переиспользовать между запусками парсера,
+    чтобы не платить за TCP+TLS рукопожатие на каждую страницу.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
 
 
 class BaseAPIParser(ABC):
@@ -23,12 +66,65 @@ class BaseAPIParser(ABC):
     Реализует общую логику: запросы, retry, обработку, сохранение.
     """
 
-    def __init__(self, headers: Dict[str, str], max_retries: int = 5, max_pages: int = 50):
+    page_size = 1000
+    # Поля элемента, нужные process_item, — при потоковом разборе остальное отбрасывается сразу
+    # (формат — scripts.json_stream.make_projector); None — элементы сохраняются целиком
+    item_fields: Optional[Dict[str, Any]] = None
+    # Поле ответа с общим числом результатов запроса (None — API его не отдаёт)
+    total_field: Optional[str] = None
+    # Потолок паузы перед повтором, секунд: Retry-After длиннее не ждём (как AdaptiveRateLimiter.max_pause)
+    max_pause = 120.0
+
+    def __init__(self, headers: Dict[str, str], max_retries: int = 5, max_pages: int = 50,
+                 max_workers: int = 1, session: Optional[requests.Session] = None,
+                 pool_size: Optional[int] = None, keep_alive: bool = True,
+                 connect_timeout: float = 10, read_timeout: float = 30,
+                 archive: Optional[PageArchiveWriter] = None, replay_path: Optional[str] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 checkpoint: Optional[RunCheckpoint] = None, stream_json: bool = False,
+                 stop_over_cap: bool = False):
         self.headers = {k: v for k, v in headers.items() if v}  # Убираем пустые
         self.max_retries = max_retries
         self.max_pages = max_pages
+        self.max_workers = max(1, max_workers)  # 1 — последовательный режим
+        # Сколько раз подряд страница может вернуться в очередь, прежде чем пагинация остановится
         self.consecutive_errors = 0
         self.max_consecutive_errors = 3
+        # Темп запросов задаёт ограничитель (общий для всех потоков и шардов), а не фиксированные паузы.
+        # Без него (None) запросы не притормаживаются, а после 429/5xx ждёт только получивший их поток
+        self.rate_limiter = rate_limiter
+        # Заголовки отклонены API (протухла сессия) — повторять бессмысленно, нужны новые
+        self.auth_failed = False
+        # Пагинация дошла до конца (неполная или пустая страница), а не прервана ошибкой
+        self.completed = False
+        # Пагинация упёрлась в max_pages — часть данных не получена
+        self.truncated = False
+        # Пагинация остановлена: запросы, которые ещё в работе, не повторяются и не ждут пауз
+        self.stopping = threading.Event()
+        self.timeout = (connect_timeout, read_timeout)
+        # archive — куда сохранять сырые страницы; replay_path — читать страницы из архива вместо сети
+        self.archive = archive
+        self.replay_path = replay_path
+        # checkpoint — контрольные точки запуска: пагинация продолжается со страницы после последней
+        # записанной в БД, а записанные страницы отмечаются по мере того, как загрузчик забирает пачки
+        self.checkpoint = checkpoint
+        # stream_json — разбирать items потоково, по одному элементу, оставляя только item_fields.
+        # С архивом страниц отключается: в архив пишется страница целиком
+        self.stream_json = stream_json and archive is None
+        self.project_item = make_projector(self.item_fields)
+        # stop_over_cap — не выгружать запрос, если по первой странице видно, что результатов больше,
+        # чем помещается в max_pages: вызывающий код (ShardedInspectionsParser) делит окно сразу
+        self.stop_over_cap = stop_over_cap
+
+        # Внешнюю сессию не закрываем — ей владеет вызывающий код
+        self._owns_session = session is None
+        self.session = session or create_http_session(
+            pool_size=pool_size or self.max_workers, keep_alive=keep_alive
+        )
+
+        # Базовые заголовки собираем один раз, на запрос меняется только Request-GUID
+        self.base_headers = self.headers.copy()
+        self.base_headers["Content-Type"] = "application/json"
 
     @abstractmethod
     def get_url(self) -> str:
@@ -53,6 +149,9 @@ class BaseAPIParser(ABC):
     def get_retryable_status_codes(self) -> List[int]:
         return [408, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524]
 
+    def get_auth_error_status_codes(self) -> List[int]:
+        return [401, 403, 419, 440]
+
     def fetch_page(self, page: int) -> Optional[Dict]:
         """Выполняет запрос к API с повторными попытками"""
         # Чистим URL: убираем пробелы, лишние параметры
@@ -60,158 +159,518 @@ class BaseAPIParser(ABC):
         params = self.get_params(page)
         payload = self.get_payload()
 
-        request_headers = self.headers.copy()
+        request_headers = self.base_headers.copy()
         request_headers["Request-GUID"] = str(uuid.uuid4())
-        request_headers["Content-Type"] = "application/json"
 
         retryable = self.get_retryable_status_codes()
+        auth_errors = self.get_auth_error_status_codes()
 
         for attempt in range(self.max_retries):
+            if self.stopping.is_set():
+                return None
             try:
                 logger.info(f"Попытка {attempt + 1}/{self.max_retries} для страницы {page}")
-                response = requests.post(
-                    url,
-                    headers=request_headers,
-                    params=params,
-                    json=payload,
-                    timeout=30
-                )
+                if self.rate_limiter is not None and not self.rate_limiter.acquire(stop=self.stopping):
+                    return None
+                started = time.perf_counter()
+                try:
+                    response = self.session.post(
+                        url,
+                        headers=request_headers,
+                        params=params,
+                        json=payload,
+                        timeout=self.timeout,
+                        stream=self.stream_json
+                    )
+                except requests.exceptions.Timeout:
+                    FETCH_SECONDS.observe(time.perf_counter() - started, status='timeout')
+                    raise
+                except requests.RequestException:
+                    FETCH_SECONDS.observe(time.perf_counter() - started, status='error')
+                    raise
+                FETCH_SECONDS.observe(time.perf_counter() - started, status=response.status_code)
                 logger.info(f"POST {url} — статус: {response.status_code}")
 
-                if response.status_code == 200:
-                    return response.json()
+                # В потоковом режиме тело читается по мере разбора — соединение возвращается в пул при выходе
+                with response:
+                    if self.stream_json and response.status_code != 200:
+                        # Короткое тело ошибки дочитываем, иначе соединение закроется, а не вернётся в пул
+                        response.content
+                    if response.status_code == 200:
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.on_success()
+                        data = self.read_page(response) if self.stream_json else response.json()
+                        if self.archive is not None:
+                            self.archive.write(make_query_key(url, payload), page, data)
+                        PAGES_TOTAL.inc(outcome='ok')
+                        return data
 
-                elif response.status_code in retryable:
-                    if attempt < self.max_retries - 1:
-                        delay = (2 ** attempt) + random.uniform(0, 1)
-                        logger.warning(f"Статус {response.status_code}. Повтор через {delay:.1f} сек...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        logger.error(f"Превышено кол-во попыток. Последний статус: {response.status_code}")
+                    elif response.status_code in auth_errors:
+                        logger.error(f"Статус {response.status_code}: заголовки авторизации отклонены.")
+                        self.auth_failed = True
+                        PAGES_TOTAL.inc(outcome='auth_failed')
                         return None
-                else:
-                    logger.error(f"Неожиданный статус {response.status_code}")
-                    response.raise_for_status()
+
+                    elif response.status_code in retryable:
+                        if attempt < self.max_retries - 1:
+                            # Пауза — по Retry-After сервера, без него — экспоненциальная; с ограничителем её ждут все потоки
+                            delay = self.retry_delay(attempt, response.headers.get("Retry-After"))
+                            logger.warning(f"Статус {response.status_code}. Повтор через {delay:.1f} сек...")
+                            FETCH_RETRIES.inc(reason=response.status_code)
+                            self.pause(delay)
+                            continue
+                        else:
+                            logger.error(f"Превышено кол-во попыток. Последний статус: {response.status_code}")
+                            PAGES_TOTAL.inc(outcome='failed')
+                            return None
+                    else:
+                        logger.error(f"Неожиданный статус {response.status_code}")
+                        response.raise_for_status()
 
             except requests.exceptions.Timeout:
                 if attempt < self.max_retries - 1:
-                    delay = (2 ** attempt) + random.uniform(0, 1)
+                    delay = self.retry_delay(attempt)
                     logger.warning(f"Таймаут. Повтор через {delay:.1f} сек...")
-                    time.sleep(delay)
+                    FETCH_RETRIES.inc(reason='timeout')
+                    self.pause(delay)
                     continue
                 else:
                     logger.error("Превышено кол-во попыток из-за таймаутов")
+                    PAGES_TOTAL.inc(outcome='failed')
                     return None
 
             except requests.RequestException as e:
                 if attempt < self.max_retries - 1:
-                    delay = (2 ** attempt) + random.uniform(0, 1)
+                    delay = self.retry_delay(attempt)
                     logger.warning(f"Ошибка: {e}. Повтор через {delay:.1f} сек...")
-                    time.sleep(delay)
+                    FETCH_RETRIES.inc(reason='error')
+                    self.pause(delay)
                     continue
                 else:
                     logger.error(f"Превышено кол-во попыток. Последняя ошибка: {e}")
+                    PAGES_TOTAL.inc(outcome='failed')
                     return None
 
+        PAGES_TOTAL.inc(outcome='failed')
         return None
 
+    def read_page(self, response: requests.Response) -> Dict:
+        """
+        Потоковый разбор страницы: элементы items декодируются по одному по мере чтения тела,
+        и от каждого сразу остаются только item_fields — целиком в памяти один элемент, а не вся страница.
+        """
+        data = {}
+        project = self.project_item
+        try:
+            chunks = response.iter_content(STREAM_CHUNK_SIZE)
+            data["items"] = [project(item) for item in iter_object_items(chunks, meta=data)]
+            # Хвост после закрывающей скобки (пробелы) тоже дочитываем — ради возврата соединения в пул
+            for _ in chunks:
+                pass
+        except json.JSONDecodeError as e:
+            # Как у response.json(): битый ответ — повод повторить запрос
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+        return data
+
+    def pause(self, delay: float):
+        """Пауза после 429/5xx/таймаута: с ограничителем — общая для всех потоков, без него — только этого"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.on_throttle(delay)
+        else:
+            self.stopping.wait(delay)
+
+    @staticmethod
+    def backoff_delay(attempt: int) -> float:
+        """Экспоненциальная пауза с джиттером — когда сервер не прислал Retry-After"""
+        return (2 ** attempt) + random.uniform(0, 1)
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Пауза перед повтором: по Retry-After, без него — экспоненциальная; не больше max_pause"""
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+        return min(delay, self.max_pause)
+
+    def checkpoint_key(self) -> str:
+        """Ключ запроса для контрольных точек — тот же, что и в архиве страниц"""
+        return make_query_key(self.get_url().strip(), self.get_payload())
+
+    def resume_page(self) -> int:
+        if self.checkpoint is None:
+            return 1
+        page = self.checkpoint.next_page(self.checkpoint_key())
+        if page > 1:
+            logger.info(f"Продолжаем с контрольной точки: страница {page}")
+        return page
+
+    def save_progress(self, page: int, done: bool = False):
+        """
+        Страница page записана в БД. Вызывается после yield: генератор продолжается,
+        только когда загрузчик закоммитил отданную пачку и попросил следующую.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.commit_page(self.checkpoint_key(), page, done)
+
+    def over_capacity(self, data: Dict) -> bool:
+        """
+        По ответу на первую страницу: результатов не меньше, чем можно получить за max_pages страниц.
+        Ровно max_pages полных страниц тоже не помещаются: конец выдачи виден только по неполной странице.
+        """
+        total = data.get(self.total_field) if self.total_field else None
+        return isinstance(total, int) and total >= self.max_pages * self.page_size
+
+    def page_limit(self, data: Dict, page: int) -> int:
+        """
+        Последняя страница, которую стоит запрашивать после ответа data на страницу page:
+        по total — ceil(total / page_size), без него — max_pages. Если полная страница
+        оказалась последней по total (выдача выросла или total кратен page_size),
+        разрешается ещё одна — конец выдачи виден только по неполной странице.
+        """
+        total = data.get(self.total_field) if self.total_field else None
+        limit = -(-total // self.page_size) if isinstance(total, int) else self.max_pages
+        if len(data.get("items") or ()) >= self.page_size:
+            limit = max(limit, page + 1)
+        return min(limit, self.max_pages)
+
+    def requeue_page(self, page: int) -> bool:
+        """
+        Страница не получена после всех попыток: вместо пропуска её запрашивают снова.
+        False — страница не далась max_consecutive_errors раз подряд, пагинацию нужно остановить
+        (completed останется False, и неполная выгрузка не удалит отсутствующие записи).
+        """
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= self.max_consecutive_errors:
+            logger.error(f"Страница {page} не получена {self.consecutive_errors} раз подряд. Остановка.")
+            return False
+        PAGES_REQUEUED.inc()
+        logger.warning(f"Страница {page} не получена, повторяем её. Ошибки подряд: {self.consecutive_errors}")
+        return True
+
+    def process_page(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """Обрабатывает все элементы одной страницы, пропуская некорректные"""
+        processed_items = []
+        skipped_count = 0
+        skipped_examples = []
+        unchanged_count = 0
+        for item in items:
+            if not isinstance(item, dict):
+                skipped_count += 1
+                if len(skipped_examples) < 5:
+                    skipped_examples.append(repr(item))
+                continue
+            if not self.should_process(item):
+                unchanged_count += 1
+                continue
+            try:
+                processed = self.process_item(item)
+                processed_items.append(processed)
+            except Exception as e:
+                ITEM_FAILURES.inc()
+                logger.warning(f"Ошибка при обработке элемента: {e} | item: {repr(item)}")
+                continue
+        ITEMS_PROCESSED.inc(len(processed_items))
+        if skipped_count > 0:
+            ITEMS_SKIPPED.inc(skipped_count, reason='not_dict')
+            logger.warning(f"Пропущено несловарных элементов: {skipped_count}")
+            if skipped_examples:
+                logger.warning(f"Примеры пропущенных: {skipped_examples}")
+        if unchanged_count > 0:
+            ITEMS_SKIPPED.inc(unchanged_count, reason='unchanged')
+            logger.info(f"Пропущено неизменённых элементов: {unchanged_count}")
+        return processed_items
+
+    def should_process(self, item: Dict[str, Any]) -> bool:
+        """Фильтр на стороне клиента: False — элемент не изменился и обрабатывать его не нужно"""
+        return True
+
+    def close(self):
+        """Закрывает HTTP-сессию, если она создана самим парсером"""
+        if self._owns_session:
+            self.session.close()
+
     def run(self) -> List[Dict[str, Any]]:
-        logger.info("Запуск парсера...")
         all_data = []
-        page = 1
+        for batch in self.iter_batches():
+            all_data.extend(batch)
+        return all_data
+
+    def iter_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Потоковый режим: отдаёт обработанные записи постранично, по мере получения.
+        В памяти держится не больше одной страницы на поток, а загрузчик
+        может сохранять данные, не дожидаясь конца пагинации.
+        """
+        self.auth_failed = False
+        self.completed = False
+        self.truncated = False
+        self.stopping.clear()
+        try:
+            if self.checkpoint is not None and not self.replay_path and self.checkpoint.is_done(self.checkpoint_key()):
+                logger.info("Запрос уже выгружен в прерванном запуске — пропускаем.")
+                self.completed = True
+                return
+            if self.replay_path:
+                yield from self.iter_replay_batches()
+            elif self.max_workers > 1:
+                yield from self.iter_batches_concurrent()
+            else:
+                yield from self.iter_batches_serial()
+        finally:
+            self.close()
+
+    def iter_batches_serial(self) -> Iterator[List[Dict[str, Any]]]:
+        logger.info("Запуск парсера...")
+        page = self.resume_page()
 
         while page <= self.max_pages:
             try:
                 logger.info(f"Обрабатываем страницу {page}...")
                 data = self.fetch_page(page)
 
+                if self.auth_failed:
+                    logger.error("Остановка: требуется повторное получение заголовков.")
+                    break
+
                 if not data:
-                    self.consecutive_errors += 1
-                    logger.warning(f"Не удалось получить данные. Ошибки подряд: {self.consecutive_errors}")
-                    if self.consecutive_errors >= self.max_consecutive_errors:
-                        logger.error("Превышено макс. кол-во последовательных ошибок. Остановка.")
+                    if not self.requeue_page(page):
                         break
-                    delay = min(30, 2 ** self.consecutive_errors)
-                    time.sleep(delay)
-                    page += 1
                     continue
 
                 if not data.get("items"):
                     logger.info("Данные закончились.")
+                    self.completed = True
+                    self.save_progress(page - 1, done=True)
+                    break
+
+                if self.stop_over_cap and page == 1 and self.over_capacity(data):
+                    logger.info(f"Результатов ({data[self.total_field]}) больше, чем помещается в max_pages={self.max_pages}.")
+                    self.truncated = True
                     break
 
                 self.consecutive_errors = 0
                 items = data["items"]
                 logger.info(f"Получено {len(items)} записей на странице {page}.")
 
-                processed_items = []
-                skipped_count = 0
-                skipped_examples = []
-                for item in items:
-                    if not isinstance(item, dict):
-                        skipped_count += 1
-                        if len(skipped_examples) < 5:
-                            skipped_examples.append(repr(item))
-                        continue
-                    try:
-                        processed = self.process_item(item)
-                        processed_items.append(processed)
-                    except Exception as e:
-                        logger.warning(f"Ошибка при обработке элемента: {e} | item: {repr(item)}")
-                        continue
-                if skipped_count > 0:
-                    logger.warning(f"Пропущено несловарных элементов: {skipped_count}")
-                    if skipped_examples:
-                        logger.warning(f"Примеры пропущенных: {skipped_examples}")
-
-                all_data.extend(processed_items)
+                processed_items = self.process_page(items)
                 logger.info(f"Обработано {len(processed_items)} записей.")
+                yield processed_items
 
-                if len(items) < 1000:
-                    logger.info("Меньше 1000 записей — завершаем пагинацию.")
+                if len(items) < self.page_size:
+                    logger.info(f"Меньше {self.page_size} записей — завершаем пагинацию.")
+                    self.completed = True
+                    self.save_progress(page, done=True)
                     break
 
+                self.save_progress(page)
                 page += 1
-                time.sleep(1)
 
             except KeyboardInterrupt:
                 logger.info("Парсинг прерван пользователем.")
                 break
             except Exception as e:
-                self.consecutive_errors += 1
                 logger.error(f"Неожиданная ошибка: {e}")
-                if self.consecutive_errors >= self.max_consecutive_errors:
-                    logger.error("Превышено макс. кол-во ошибок. Остановка.")
+                if not self.requeue_page(page):
                     break
-                delay = min(30, 2 ** self.consecutive_errors)
-                time.sleep(delay)
-                page += 1
                 continue
+        else:
+            logger.warning(f"Достигнут лимит max_pages={self.max_pages}, данные могут быть неполными.")
+            self.truncated = True
 
-        return all_data
+    def iter_replay_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Офлайн-режим: страницы читаются из архива (в порядке записи) без обращения к API.
+        Обрабатываются все страницы архива, независимо от окна поиска парсера.
+        """
+        logger.info(f"Воспроизведение архива {self.replay_path}...")
+        pages = 0
+        seen_pages = set()
+        for key, page, data in read_archive(self.replay_path):
+            # Одна и та же страница могла попасть в архив дважды (повторные запуски в один файл)
+            if (key, page) in seen_pages:
+                continue
+            seen_pages.add((key, page))
+            items = data.get("items") if isinstance(data, dict) else None
+            if not items:
+                continue
+            pages += 1
+            yield self.process_page(items)
+        logger.info(f"Из архива обработано страниц: {pages}")
+        self.completed = True
+
+    def iter_batches_concurrent(self) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Параллельная пагинация: держит в работе до max_workers запросов,
+        а результаты разбирает строго в порядке страниц. Если API отдаёт total, до первого
+        ответа запрашивается одна страница, а дальше — не дальше последней по total (page_limit). Как только встречена
+        неполная или пустая страница (или генератор закрыт), оставшиеся запросы отменяются:
+        ещё не начатые не отправляются, а начатые не повторяются и не ждут пауз — остановка
+        ждёт не дольше одного HTTP-запроса (timeout).
+        """
+        logger.info(f"Запуск парсера (параллельно, потоков: {self.max_workers})...")
+        pending = {}
+        page = self.resume_page()  # следующая страница для разбора
+        next_page = page           # следующая страница для отправки
+        # Последняя страница, которую стоит запрашивать: без total — max_pages, с ним — сначала только первая
+        limit = self.max_pages if self.total_field is None else page
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit():
+                nonlocal next_page
+                while next_page <= limit and len(pending) < self.max_workers:
+                    pending[next_page] = executor.submit(self.fetch_page, next_page)
+                    next_page += 1
+
+            try:
+                while page <= self.max_pages:
+                    submit()
+
+                    future = pending.pop(page)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        logger.error(f"Неожиданная ошибка на странице {page}: {e}")
+                        data = None
+
+                    if self.auth_failed:
+                        logger.error("Остановка: требуется повторное получение заголовков.")
+                        break
+
+                    if not data:
+                        if not self.requeue_page(page):
+                            break
+                        pending[page] = executor.submit(self.fetch_page, page)
+                        continue
+
+                    if not data.get("items"):
+                        logger.info("Данные закончились.")
+                        self.completed = True
+                        self.save_progress(page - 1, done=True)
+                        break
+
+                    if self.stop_over_cap and page == 1 and self.over_capacity(data):
+                        logger.info(f"Результатов ({data[self.total_field]}) больше, чем помещается в max_pages={self.max_pages}.")
+                        self.truncated = True
+                        break
+
+                    self.consecutive_errors = 0
+                    items = data["items"]
+                    logger.info(f"Получено {len(items)} записей на странице {page}.")
+                    # Следующие страницы уходят в работу, пока загрузчик пишет эту
+                    limit = self.page_limit(data, page)
+                    submit()
+
+                    processed_items = self.process_page(items)
+                    logger.info(f"Обработано {len(processed_items)} записей.")
+                    yield processed_items
+
+                    if len(items) < self.page_size:
+                        logger.info(f"Меньше {self.page_size} записей — завершаем пагинацию.")
+                        self.completed = True
+                        self.save_progress(page, done=True)
+                        break
+
+                    self.save_progress(page)
+                    page += 1
+                else:
+                    logger.warning(f"Достигнут лимит max_pages={self.max_pages}, данные могут быть неполными.")
+                    self.truncated = True
+
+            except KeyboardInterrupt:
+                logger.info("Парсинг прерван пользователем.")
+            finally:
+                self.stopping.set()
+                for future in pending.values():
+                    future.cancel()
 
     def safe_get(self, d, key, default=''):
         return d[key] if isinstance(d, dict) and key in d else default
 
 
+# Справочники и извлекатели полей собираются один раз при импорте, а не на каждый элемент
+STATUS_MAP = {"CANCELLED": "Отменена", "PLANNED": "Запланирована"}
+
+
+def path_getter(*keys, default=''):
+    """Возвращает функцию, которая достаёт значение по цепочке ключей (как вложенные safe_get)"""
+    def get(d):
+        for key in keys:
+            if isinstance(d, dict) and key in d:
+                d = d[key]
+            else:
+                return default
+        return d
+    return get
+
+
+get_entity_name = path_getter('subject', 'organizationInfoEnriched', 'registryOrganizationCommonDetailWithNsi', 'shortName')
+get_ogrn = path_getter('subject', 'organizationInfoEnriched', 'registryOrganizationCommonDetailWithNsi', 'ogrn')
+get_change_reason = path_getter('examinationChangeInfo', 'changingBase', 'name')
+
+
+@lru_cache(maxsize=65536)
+def format_edit_minute(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60, tz=timezone.utc).strftime('%d.%m.%Y %H:%M')
+
+
+def format_edit_timestamp(ms) -> str:
+    """Форматирует lastEditingDate (мс) с точностью до минуты; повторы берутся из кэша"""
+    try:
+        return format_edit_minute(int(ms // 60000))
+    except Exception:
+        return ''
+
+
+def compose_status(status: str, change_reason: str, changed_at: Optional[int]) -> str:
+    """
+    Собирает статус в одну строку: "<статус>. Изменено. Основание: ... Последнее изменение: ...".
+    Тот же формат строит представление SqliteLoader из отдельных колонок.
+    """
+    last_edit_str = format_edit_timestamp(changed_at * 1000) if changed_at is not None else ''
+    if change_reason or last_edit_str:
+        status += f". Изменено. Основание: {change_reason} Последнее изменение: {last_edit_str}"
+    return status.strip()
+
+
 class GosuslugiInspectionsParser(BaseAPIParser):
     """
     Конкретная реализация для API проверок Госуслуг
     """
 
+    api_url = "https://dom.gosuslugi.ru/inspection/api/rest/services/examinations/public/search"
+    total_field = 'total'
+
+    def __init__(self, headers: Dict[str, str], window: Optional[Tuple[datetime, datetime]] = None,
+                 changed_since: Optional[int] = None, as_tuples: bool = False,
+                 api_url: Optional[str] = None, **kwargs):
+        super().__init__(headers, **kwargs)
+        # api_url — другой адрес того же API (например, локальный scripts.fake_api для бенчмарков)
+        if api_url:
+            self.api_url = api_url
+        # as_tuples=True — страницы отдаются кортежами (output_fields) вместо словарей
+        self.as_tuples = as_tuples
+        # Инкрементальный режим: lastEditingDate (мс), после которого запись считается изменённой
+        self.changed_since = changed_since
+        # Максимальный lastEditingDate среди полученных элементов — новая отметка для следующего запуска
+        self.max_last_edit = changed_since or 0
+        # Окно поиска по дате начала проверки фиксируется при создании, чтобы не «ехать» между страницами
+        if window is None:
+            now = datetime.now(timezone.utc)
+            window = (now - relativedelta(days=31), now)
+        self.window = window
+
+    @staticmethod
+    def format_api_datetime(dt: datetime) -> str:
+        return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{dt.microsecond // 1000:03d}Z'
+
     def get_url(self) -> str:
-        return "https://dom.gosuslugi.ru/inspection/api/rest/services/examinations/public/search "
+        return self.api_url
 
     def get_params(self, page: int) -> dict:
-        return {"page": page, "itemsPerPage": 1000}
+        return {"page": page, "itemsPerPage": self.page_size}
 
     def get_payload(self) -> dict:
-        now = datetime.now(timezone.utc)
-        one_month_ago = now - relativedelta(days=31)
-
-        exam_start_from = one_month_ago.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        exam_start_to = now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        exam_start_from = self.format_api_datetime(self.window[0])
+        exam_start_to = self.format_api_datetime(self.window[1])
 
         return {
             "numberOrUriNumber": None,
@@ -228,73 +687,417 @@ class GosuslugiInspectionsParser(BaseAPIParser):
             "typeList": []
         }
 
-    def format_status(self, item: Dict[str, Any]) -> str:
-        status = self.safe_get(item, 'status', '')
-        is_assigned = self.safe_get(item, 'isAssigned', False)
-
-        if status == "FINISHED":
-            return "Назначено" if is_assigned else "Завершено"
-
-        status_map = {"CANCELLED": "Отменена", "PLANNED": "Запланирована"}
-        result_status = status_map.get(status, status)
-
-        change_info = self.safe_get(item, 'examinationChangeInfo', {})
+    def should_process(self, item: Dict[str, Any]) -> bool:
         last_edit = self.safe_get(item, 'lastEditingDate', None)
+        if isinstance(last_edit, (int, float)) and last_edit > self.max_last_edit:
+            self.max_last_edit = int(last_edit)
+        if self.changed_since is None or not last_edit:
+            # Без отметки изменения не понять, менялась ли запись, — обрабатываем
+            return True
+        return last_edit > self.changed_since
 
-        reason = self.safe_get(self.safe_get(change_info, 'changingBase', {}), 'name', '')
+    def split_status(self, item: Dict[str, Any]) -> Tuple[str, str, Optional[int]]:
+        """Статус, основание изменения и время последнего изменения (секунды epoch) — для отдельных колонок БД"""
+        status = item.get('status', '')
 
-        if last_edit:
-            try:
-                dt = datetime.fromtimestamp(last_edit / 1000, tz=timezone.utc)
-                last_edit_str = dt.strftime('%d.%m.%Y %H:%M')
-            except:
-                last_edit_str = ''
-        else:
-            last_edit_str = ''
+        if status == "FINISHED":
+            return ("Назначено" if item.get('isAssigned', False) else "Завершено"), '', None
 
-        if reason or last_edit_str:
-            additional_info = f". Изменено. Основание: {reason} Последнее изменение: {last_edit_str}"
-            result_status += additional_info
+        last_edit = item.get('lastEditingDate', None)
+        changed_at = int(last_edit // 1000) if isinstance(last_edit, (int, float)) and last_edit else None
+        return STATUS_MAP.get(status, status), get_change_reason(item), changed_at
 
-        return result_status.strip()
+    def format_status(self, item: Dict[str, Any]) -> str:
+        """Статус одной строкой, как его показывает веб-интерфейс"""
+        return compose_status(*self.split_status(item))
 
     def format_result(self, item: Dict[str, Any]) -> str:
-        examination_result = self.safe_get(item, 'examinationResult', {})
-        result = self.safe_get(examination_result, 'desc', '')
-        has_offence = self.safe_get(examination_result, 'hasOffence', None)
+        examination_result = item.get('examinationResult', {})
+        if isinstance(examination_result, dict):
+            result = examination_result.get('desc', '')
+            has_offence = examination_result.get('hasOffence', None)
+        else:
+            result, has_offence = '', None
         if has_offence is None:
-            has_offence = self.safe_get(item, 'hasOffence', None)
+            has_offence = item.get('hasOffence', None)
 
         if has_offence is True:
-            return "Нарушения выявлены (в том числе факты невыполнения предписаний)"
+            return OFFENCE_FOUND
         elif has_offence is False:
-            return "Нарушений не выявлено"
+            return OFFENCE_NOT_FOUND
         return result
 
+    # Всё, что читают split_status, format_result, build_row и should_process
+    item_fields = {
+        'guid': None, 'id': None, 'status': None, 'isAssigned': None, 'lastEditingDate': None,
+        'examObjective': None, 'from': None, 'hasOffence': None,
+        'subject': {'organizationInfoEnriched': {'registryOrganizationCommonDetailWithNsi': {'shortName': None, 'ogrn': None}}},
+        'examinationChangeInfo': {'changingBase': {'name': None}},
+        'examinationResult': {'desc': None, 'hasOffence': None},
+    }
+
+    # Порядок полей в строках пакетного разбора: SqliteLoader.input_fields + external_id последним
+    output_fields = ('entity_name', 'ogrn', 'purpose', 'status', 'change_reason', 'changed_at',
+                     'result', 'examStartDate', 'external_id')
+
+    def build_row(self, item: Dict[str, Any]) -> tuple:
+        status, change_reason, changed_at = self.split_status(item)
+        return (
+            get_entity_name(item),
+            get_ogrn(item),
+            item.get('examObjective', ''),
+            status,
+            change_reason,
+            changed_at,
+            self.format_result(item),
+            item.get('from', ''),
+            item.get('guid', '') or item.get('id', ''),
+        )
+
+    def transform_page(self, items: List[Any]) -> List[tuple]:
+        """
+        Пакетный разбор страницы в кортежи (порядок — output_fields), которые можно
+        сразу отдавать загрузчику. Ошибки не логируются по одной: в лог попадает
+        их число и один укороченный пример.
+        """
+        rows = []
+        append = rows.append
+        build_row = self.build_row
+        should_process = self.should_process
+        empty_row = ('',) * len(self.output_fields)
+        skipped_count = unchanged_count = failed_count = 0
+        first_error = None
+        for item in items:
+            if not isinstance(item, dict):
+                skipped_count += 1
+                continue
+            if not should_process(item):
+                unchanged_count += 1
+                continue
+            try:
+                append(build_row(item))
+            except Exception as e:
+                failed_count += 1
+                if first_error is None:
+                    first_error = f"{e} | item: {repr(item)[:300]}"
+                append(empty_row)
+        ITEMS_PROCESSED.inc(len(rows))
+        if skipped_count:
+            ITEMS_SKIPPED.inc(skipped_count, reason='not_dict')
+            logger.warning(f"Пропущено несловарных элементов: {skipped_count}")
+        if unchanged_count:
+            ITEMS_SKIPPED.inc(unchanged_count, reason='unchanged')
+            logger.info(f"Пропущено неизменённых элементов: {unchanged_count}")
+        if failed_count:
+            ITEM_FAILURES.inc(failed_count)
+            logger.warning(f"Критических ошибок при обработке элементов: {failed_count}. Пример: {first_error}")
+        return rows
+
+    def process_page(self, items: List[Any]) -> List[Dict[str, Any]]:
+        rows = self.transform_page(items)
+        if self.as_tuples:
+            return rows
+        fields = self.output_fields
+        return [dict(zip(fields, row)) for row in rows]
+
     def process_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            subject = self.safe_get(item, 'subject', {})
-            org_info = self.safe_get(subject, 'organizationInfoEnriched', {})
-            registry = self.safe_get(org_info, 'registryOrganizationCommonDetailWithNsi', {})
-
-            entity_name = self.safe_get(registry, 'shortName', '')
-            ogrn = self.safe_get(registry, 'ogrn', '')
-            purpose = self.safe_get(item, 'examObjective', '')
-            status = self.format_status(item)
-            result = self.format_result(item)
-            examStartDate = self.safe_get(item, 'from', '')
+            row = self.build_row(item)
         except Exception as e:
-            logger.warning(f"Критическая ошибка при обработке элемента: {e} | item: {repr(item)}")
-            entity_name = ogrn = purpose = status = result = examStartDate = ''
+            ITEM_FAILURES.inc()
+            logger.warning(f"Критическая ошибка при обработке элемента: {e} | item: {repr(item)[:300]}")
+            row = ('',) * len(self.output_fields)
+        return dict(zip(self.output_fields, row))
 
-        return {
-            'entity_name': entity_name,
-            'ogrn': ogrn,
-            'purpose': purpose,
-            'status': status,
-            'result': result,
-            'examStartDate': examStartDate
-        }
+
+class ShardFetch:
+    """Выгрузка одного подокна в ShardedInspectionsParser: страницы в работе и порядок их разбора"""
+
+    def __init__(self, shard: Tuple[datetime, datetime], parser: GosuslugiInspectionsParser,
+                 already_sent: Optional[Counter]):
+        self.shard = shard
+        self.parser = parser
+        # Сколько копий каждой записи уже отдали обрезанные предки подокна (None — предков нет)
+        self.already_sent = already_sent
+        # Счётчик отданных записей подокна — для пропуска при догрузке его половин
+        self.counts = Counter()
+        self.page = parser.resume_page()  # следующая страница для разбора
+        self.next_page = self.page        # следующая страница для отправки
+        # Последняя страница, которую стоит запрашивать: до первого ответа с total — только первая
+        self.limit = parser.max_pages if parser.total_field is None else self.page
+        self.futures = {}
+
+    def wants_page(self) -> bool:
+        return self.next_page <= min(self.limit, self.parser.max_pages)
+
+    def ready(self) -> bool:
+        """Следующая по порядку страница получена — её можно разбирать"""
+        future = self.futures.get(self.page)
+        return future is not None and future.done()
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+
+class ShardedInspectionsParser:
+    """
+    Шардирование поиска по времени: окно [start, end) выгружается подокнами. По умолчанию подокно
+    одно — всё окно; shard_days задаёт начальное деление. Если в подокне больше результатов, чем API
+    отдаёт за max_pages страниц (видно по total первой страницы или по упору в max_pages),
+    оно делится пополам. Записи, уже отданные обрезанным подокном, при догрузке половин пропускаются.
+    Страницы всех подокон идут через один пул потоков с общим бюджетом в max_workers запросов:
+    свободные потоки берут страницы следующих подокон, а в пределах подокна запрашиваются страницы
+    только до последней по total. Страницы подокна разбираются по порядку и отдаются постранично:
+    в памяти — не больше max_workers страниц. Закрытие генератора останавливает запросы в работе.
+    С checkpoint прогресс сохраняется постранично, как у GosuslugiInspectionsParser: прерванный запуск
+    пропускает выгруженные подокна, продолжает начатые со следующей страницы, а разделённые — с половин.
+    С as_tuples=True (в parser_kwargs) страницы отдаются кортежами и идут в загрузчик без словарей.
+    Интерфейс совпадает с BaseAPIParser: iter_batches(), run(), completed, auth_failed.
+    """
+
+    def __init__(self, headers: Dict[str, str], start: datetime, end: datetime,
+                 shard_days: Optional[float] = None, max_workers: int = 4, max_pages: int = 50,
+                 min_shard: timedelta = timedelta(hours=1),
+                 session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 checkpoint: Optional[RunCheckpoint] = None, **parser_kwargs):
+        self.headers = headers
+        self.start = start
+        self.end = end
+        self.shard_size = timedelta(days=shard_days) if shard_days else None
+        self.max_workers = max(1, max_workers)
+        self.max_pages = max_pages
+        self.min_shard = min_shard
+        self._owns_session = session is None
+        self.session = session or create_http_session(pool_size=self.max_workers)
+        # Один ограничитель на все подокна: 429 в одном шарде притормаживает и остальные
+        self.rate_limiter = rate_limiter
+        # Контрольные точки ставят парсеры подокон — после записи каждой страницы
+        self.checkpoint = checkpoint
+        self.parser_kwargs = parser_kwargs
+        self.completed = False
+        self.auth_failed = False
+        self.max_last_edit = parser_kwargs.get('changed_since') or 0
+        # Общее для парсеров подокон событие остановки: запросы в работе не повторяются и не ждут пауз
+        self.stopping = threading.Event()
+
+    def plan_shards(self) -> List[Tuple[datetime, datetime]]:
+        """Делит окно на последовательные неперекрывающиеся подокна (без shard_days — одно подокно)"""
+        if self.shard_size is None:
+            return [(self.start, self.end)]
+        shards = []
+        left = self.start
+        while left < self.end:
+            right = min(left + self.shard_size, self.end)
+            shards.append((left, right))
+            left = right
+        return shards
+
+    def make_parser(self, shard: Tuple[datetime, datetime]) -> GosuslugiInspectionsParser:
+        # Граница API включительная — сдвигаем конец на 1 мс, чтобы соседние подокна не пересекались
+        window = (shard[0], shard[1] - timedelta(milliseconds=1))
+        parser = GosuslugiInspectionsParser(
+            headers=self.headers, window=window, max_pages=self.max_pages, max_workers=self.max_workers,
+            session=self.session, rate_limiter=self.rate_limiter, checkpoint=self.checkpoint,
+            stop_over_cap=shard[1] - shard[0] > self.min_shard, **self.parser_kwargs
+        )
+        parser.stopping = self.stopping
+        return parser
+
+    # Позиция external_id в кортежах пакетного разбора (as_tuples=True)
+    external_id_pos = GosuslugiInspectionsParser.output_fields.index('external_id')
+
+    @classmethod
+    def item_key(cls, item) -> tuple:
+        """Ключ записи для пропуска уже отданных: id из API, без него — всё содержимое (кортеж или словарь)"""
+        if isinstance(item, tuple):
+            external_id = item[cls.external_id_pos]
+            return ('ext', external_id) if external_id else item
+        external_id = item.get('external_id')
+        return ('ext', external_id) if external_id else tuple(sorted(item.items()))
+
+    def shard_key(self, shard: Tuple[datetime, datetime]) -> str:
+        return self.make_parser(shard).checkpoint_key()
+
+    def submit_pages(self, executor: ThreadPoolExecutor, active: List[ShardFetch],
+                     pending: List[Tuple[Tuple[datetime, datetime], Optional[Counter]]]):
+        """
+        Заполняет бюджет запросов: сначала страницы уже начатых подокон (по порядку начала —
+        чтобы они раньше заканчивались), на остаток — первые страницы следующих подокон.
+        """
+        in_flight = sum(len(fetch.futures) for fetch in active)
+        for fetch in active:
+            while in_flight < self.max_workers and fetch.wants_page():
+                fetch.futures[fetch.next_page] = executor.submit(fetch.parser.fetch_page, fetch.next_page)
+                fetch.next_page += 1
+                in_flight += 1
+        while in_flight < self.max_workers and pending:
+            shard, already_sent = pending.pop()
+            fetch = ShardFetch(shard, self.make_parser(shard), already_sent)
+            if fetch.page > self.max_pages:
+                # Подокно разделено прерванным запуском — сразу к половинам
+                self.split_shard(fetch, pending)
+                continue
+            active.append(fetch)
+            while in_flight < self.max_workers and fetch.wants_page():
+                fetch.futures[fetch.next_page] = executor.submit(fetch.parser.fetch_page, fetch.next_page)
+                fetch.next_page += 1
+                in_flight += 1
+
+    def take_page(self, fetch: ShardFetch, executor: ThreadPoolExecutor) -> Tuple[Optional[str], Optional[list]]:
+        """
+        Разбирает следующую по порядку страницу подокна. Возвращает (итог, пачка): итог None —
+        подокно продолжается, 'done' — выгружено, 'truncated' — не помещается в max_pages,
+        'failed' — страница не далась, 'auth_failed' — заголовки отклонены; пачка — записи страницы
+        без уже отданных предками (None — страница не принята).
+        """
+        parser = fetch.parser
+        page = fetch.page
+        try:
+            data = fetch.futures.pop(page).result()
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка на странице {page}: {e}")
+            data = None
+
+        if parser.auth_failed:
+            return 'auth_failed', None
+        if not data:
+            if not parser.requeue_page(page):
+                return 'failed', None
+            fetch.futures[page] = executor.submit(parser.fetch_page, page)
+            return None, None
+        items = data.get("items")
+        if not items:
+            parser.save_progress(page - 1, done=True)
+            return 'done', None
+        if parser.stop_over_cap and page == 1 and parser.over_capacity(data):
+            logger.info(f"Результатов ({data[parser.total_field]}) больше, чем помещается в max_pages={self.max_pages}.")
+            return 'truncated', None
+
+        parser.consecutive_errors = 0
+        fetch.limit = parser.page_limit(data, page)
+        fetch.page += 1
+        batch = []
+        # Отдаём только копии сверх отданных предками. Без id из API одинаковые по содержимому
+        # записи из разных половин могут схлопнуться
+        for item in parser.process_page(items):
+            key = self.item_key(item)
+            fetch.counts[key] += 1
+            if fetch.already_sent is None or fetch.counts[key] > fetch.already_sent[key]:
+                batch.append(item)
+        self.max_last_edit = max(self.max_last_edit, parser.max_last_edit)
+        if len(items) < parser.page_size:
+            return 'done', batch
+        if page >= self.max_pages:
+            logger.warning(f"Достигнут лимит max_pages={self.max_pages} в подокне.")
+            return 'truncated', batch
+        return None, batch
+
+    def split_shard(self, fetch: ShardFetch, pending: List[Tuple[Tuple[datetime, datetime], Optional[Counter]]]):
+        """Кладёт половины обрезанного подокна в начало очереди (первой выгрузится левая)"""
+        shard = fetch.shard
+        middle = shard[0] + (shard[1] - shard[0]) / 2
+        logger.info(f"Подокно {shard[0]:%Y-%m-%d %H:%M} — {shard[1]:%Y-%m-%d %H:%M} "
+                    f"не помещается в max_pages, делим пополам")
+        if self.checkpoint is not None:
+            # Страницы разделённого подокна больше не запрашиваются: продолженный запуск
+            # сразу упрётся в max_pages и перейдёт к половинам
+            self.checkpoint.commit_page(fetch.parser.checkpoint_key(), self.max_pages)
+        sent = Counter(fetch.already_sent) if fetch.already_sent is not None else Counter()
+        for key, count in fetch.counts.items():
+            sent[key] = max(sent[key], count)
+        for half in ((middle, shard[1]), (shard[0], middle)):
+            if self.checkpoint is not None and self.checkpoint.is_done(self.shard_key(half)):
+                continue
+            pending.append((half, sent if sent else None))
+
+    def iter_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        shards = self.plan_shards()
+        if self.checkpoint is not None:
+            pending_shards = [shard for shard in shards if not self.checkpoint.is_done(self.shard_key(shard))]
+            if len(pending_shards) < len(shards):
+                logger.info(f"Продолжаем с контрольной точки: подокон уже выгружено {len(shards) - len(pending_shards)}")
+            shards = pending_shards
+        logger.info(f"Шардированная выгрузка: {len(shards)} подокон, потоков: {self.max_workers}")
+        # completed выставляется только после того, как цикл дошёл до конца: если загрузчик упал
+        # на пачке или генератор закрыли раньше, выгрузка не считается завершённой
+        self.completed = False
+        self.auth_failed = False
+        self.stopping.clear()
+        completed = True
+        # Очередь подокон — стек (подокно, сколько копий каждой записи уже отдали его обрезанные предки).
+        # После продолжения запуска счётчики предков не восстанавливаются: их записи могут прийти повторно,
+        # upsert по ключу записи это переносит
+        pending = [(shard, None) for shard in reversed(shards)]
+        active = []
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while active or pending:
+                self.submit_pages(executor, active, pending)
+                if not active:
+                    continue
+                wait([future for fetch in active for future in fetch.futures.values()], return_when=FIRST_COMPLETED)
+                for fetch in list(active):
+                    while fetch.ready():
+                        page = fetch.page
+                        outcome, batch = self.take_page(fetch, executor)
+                        if batch is not None:
+                            # Следующие страницы уходят в работу, пока загрузчик пишет эту
+                            self.submit_pages(executor, active, pending)
+                            if batch:
+                                yield batch
+                            fetch.parser.save_progress(page, done=outcome == 'done')
+                        if outcome is None:
+                            continue
+                        active.remove(fetch)
+                        fetch.cancel()
+                        if outcome == 'auth_failed':
+                            self.auth_failed = True
+                            completed = False
+                            return
+                        if outcome == 'truncated' and fetch.shard[1] - fetch.shard[0] > self.min_shard:
+                            self.split_shard(fetch, pending)
+                        elif outcome != 'done':
+                            completed = False
+                        break
+            self.completed = completed
+        finally:
+            self.stopping.set()
+            for fetch in active:
+                fetch.cancel()
+            executor.shutdown(wait=True)
+            if self._owns_session:
+                self.session.close()
+
+    def run(self) -> List[Dict[str, Any]]:
+        all_data = []
+        for batch in self.iter_batches():
+            all_data.extend(batch)
+        return all_data
+
+
+def plan_sync(state: Dict[str, str], now: datetime, sync_days: int = 31,
+              full_resync_hours: float = 24, overlap_days: int = 2) -> Dict[str, Any]:
+    """
+    Выбирает режим синхронизации по сохранённой отметке (см. SqliteLoader.get_sync_state).
+    Полная — при первом запуске и раз в full_resync_hours (подхватывает изменения старых проверок).
+    Инкрементальная — окно по дате начала сужается до последней синхронизации минус overlap_days,
+    а элементы с lastEditingDate не новее отметки отбрасываются на стороне клиента.
+    """
+    full_start = now - timedelta(days=sync_days)
+    last_sync = state.get('last_sync_at')
+    last_full = state.get('last_full_sync_at')
+    full = (
+        not last_sync or not last_full
+        or now - datetime.fromisoformat(last_full) >= timedelta(hours=full_resync_hours)
+    )
+    if full:
+        return {"full": True, "start": full_start, "end": now, "changed_since": None}
+    start = max(full_start, datetime.fromisoformat(last_sync) - timedelta(days=overlap_days))
+    changed_since = int(state['last_edit_ts']) if state.get('last_edit_ts') else None
+    return {"full": False, "start": start, "end": now, "changed_since": changed_since}
 
 
 def load_to_sqlite(data: List[Dict], db_path: str = 'data/inspections.db'):
@@ -307,11 +1110,44 @@ def load_to_sqlite(data: List[Dict], db_path: str = 'data/inspections.db'):
         logger.error(f"Ошибка при загрузке в БД: {e}")
 
 
+def stream_to_sqlite(batches: Iterator[List[Dict]], db_path: str = 'data/inspections.db',
+                     mode: str = 'replace', is_complete: Optional[Callable[[], bool]] = None,
+                     run_id: Optional[str] = None) -> int:
+    """
+    Сохраняет страницы в БД по мере их поступления от парсера. Возвращает число записей;
+    при ошибке загрузки исключение пробрасывается дальше.
+    mode: 'replace' — полная перезаливка таблицы, 'upsert' — инкрементальное обновление по ключу,
+    'swap' — массовая загрузка в теневую таблицу с атомарной подменой.
+    is_complete — для 'upsert': если после загрузки возвращает False (выгрузка оборвалась),
+    отсутствующие в ней записи не удаляются.
+    run_id — для 'upsert': id запуска с контрольными точками (см. scripts.checkpoint.RunCheckpoint).
+    """
+    try:
+        loader = SqliteLoader(db_name=db_path)
+        logger.info(f"Потоковая загрузка данных в базу данных {db_path} (режим: {mode})...")
+        if mode == 'upsert':
+            total = loader.upsert_batches(batches, is_complete=is_complete, run_id=run_id)
+        elif mode == 'swap':
+            total = loader.swap_batches(batches)
+        else:
+            total = loader.insert_batches(batches)
+        logger.info(f"Загружено {total} записей в БД.")
+        return total
+    except Exception as e:
+        # Ошибку не глушим: вызывающий код не должен принять оборванную загрузку за успешную
+        logger.error(f"Ошибка при загрузке в БД: {e}")
+        raise
+
+
+def reprocess_archive(archive_path: str, db_path: str = 'data/inspections.db') -> int:
+    """Переразбирает архив сырых страниц и полностью перезаливает БД — без обращения к API"""
+    parser = GosuslugiInspectionsParser(headers={}, replay_path=archive_path, as_tuples=True)
+    return stream_to_sqlite(parser.iter_batches(), db_path=db_path, mode='swap')
+
+
 def main(headers: Dict[str, str]):
     parser = GosuslugiInspectionsParser(headers=headers)
-    data = parser.run()
+    total = stream_to_sqlite(parser.iter_batches())
 
-    if data:
-        load_to_sqlite(data)
-    else:
+    if not total:
         logger.warning("Нет данных для сохранения.")
\ No newline at end of file
@@ -0,0 +1,144 @@
+# json_stream.py — потоковый разбор ответа API вида {"items": [...], ...}
+#
+# Элементы массива items декодируются по одному по мере чтения тела ответа,
+# поэтому ни всё тело, ни вся страница разобранных словарей не держатся в памяти целиком.
+
+import json
+import codecs
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+_decoder = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+# Символы, которыми может продолжаться число ("2" -> "2.5e-3")
+NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+class JsonStreamReader:
+    """
+    Читает JSON из потока кусков байтов. Значения декодирует json.JSONDecoder.raw_decode
+    (C-сканер) прямо из буфера; если значение обрывается на конце буфера — дочитывает поток.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], trim_size: int = 1 << 16):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # Разобранное начало буфера отрезается, когда его набирается больше trim_size символов
+        self.trim_size = trim_size
+
+    def fill(self) -> bool:
+        """Дочитывает следующий кусок; False — поток закончился"""
+        if self.eof:
+            return False
+        if self.pos > self.trim_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        self.buf += self.text_decoder.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Следующий значимый символ (пробелы пропускаются); '' — конец потока"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Ожидался {char!r}, получено {found!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Декодирует очередное значение целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Значение оборвалось на конце буфера — дочитываем; иначе JSON действительно битый
+                if self.fill():
+                    continue
+                raise
+            # Число на конце буфера могло быть обрезано посередине ("12" из "123", "-2" из "-2.5"):
+            # если за ним в буфере только символы числа, дочитываем и разбираем заново
+            if (not self.eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and all(char in NUMBER_CHARS for char in self.buf[end:]) and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Элементы массива, начинающегося в текущей позиции, — по одному"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def iter_object_items(chunks: Iterable[bytes], key: str = 'items', meta: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """
+    Потоково отдаёт элементы массива key из JSON-объекта верхнего уровня.
+    Прочие поля объекта декодируются целиком и складываются в meta (если передан словарь).
+    Если поля key нет или это не массив, значение отдаётся в meta, а элементов не будет.
+    """
+    reader = JsonStreamReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        if not isinstance(name, str):
+            raise json.JSONDecodeError("Ожидался ключ объекта", reader.buf, reader.pos)
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            yield from reader.iter_array()
+        else:
+            value = reader.value()
+            if meta is not None:
+                meta[name] = value
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect('}')
+        return
+
+
+def make_projector(fields: Optional[Dict[str, Any]]) -> Callable[[Any], Any]:
+    """
+    Функция, оставляющая в словаре только поля из fields: {ключ: None — взять значение целиком,
+    ключ: {...} — вложенная выборка}. Не-словари возвращаются как есть. Выборка разворачивается
+    в замыкания один раз, а не обходится рекурсивно на каждый элемент.
+    """
+    if fields is None:
+        return lambda value: value
+    plain = tuple(name for name, sub in fields.items() if sub is None)
+    nested = tuple((name, make_projector(sub)) for name, sub in fields.items() if sub is not None)
+
+    def project(value):
+        if not isinstance(value, dict):
+            return value
+        result = {name: value[name] for name in plain if name in value}
+        for name, sub in nested:
+            if name in value:
+                result[name] = sub(value[name])
+        return result
+    return project
@@ -1,41 +1,726 @@
+import re
 import sqlite3
-from typing import List, Dict, Any
+import hashlib
+import json
+import time
+import calendar
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Dict, Any, Iterable, Optional, Callable, Tuple
+from scripts.metrics import ingest_registry
+
+LOADER_BATCH_SECONDS = ingest_registry.histogram(
+    'inspections_loader_batch_seconds', 'Запись одной пачки в SQLite (вставка и коммит)', ('mode',))
+LOADER_FINALIZE_SECONDS = ingest_registry.histogram(
+    'inspections_loader_finalize_seconds',
+    'Завершение загрузки: удаление отсутствующих записей или подмена таблицы, метаданные', ('mode',))
+LOADER_ROWS = ingest_registry.counter('inspections_loader_rows_total', 'Строки, записанные загрузчиком', ('mode',))
+
+# Результаты проверки, которые отдаёт парсер (format_result): по ним считается доля нарушений в сводках
+OFFENCE_FOUND = "Нарушения выявлены (в том числе факты невыполнения предписаний)"
+OFFENCE_NOT_FOUND = "Нарушений не выявлено"
+
+# Статус в старом (текстовом) формате: "<статус>. Изменено. Основание: <причина> Последнее изменение: <ДД.ММ.ГГГГ ЧЧ:ММ>"
+LEGACY_STATUS_RE = re.compile(
+    r'^(.*?)\. Изменено\. Основание: (.*) Последнее изменение:(?: (\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}))?$', re.S)
+LEGACY_CHANGED_MARKER = '. Изменено'
+
+
+@lru_cache(maxsize=65536)
+def date_to_epoch(value: str, formats: Tuple[str, ...] = ('%d.%m.%Y', '%Y-%m-%d')) -> Optional[int]:
+    """Дата (ДД.ММ.ГГГГ или ISO) -> секунды epoch на полночь UTC; None — дату не разобрать"""
+    for fmt in formats:
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    return None
+
+
+def split_legacy_status(status: str) -> Tuple[str, str, Optional[int]]:
+    """Разбирает статус старого формата на (статус, основание изменения, время изменения в секундах epoch)"""
+    match = LEGACY_STATUS_RE.match(status)
+    if match:
+        changed_at = date_to_epoch(match.group(3), ('%d.%m.%Y %H:%M',)) if match.group(3) else None
+        return match.group(1), match.group(2), changed_at
+    if LEGACY_CHANGED_MARKER in status:
+        return status[:status.index(LEGACY_CHANGED_MARKER)], '', None
+    return status, '', None
+
 
 class SqliteLoader:
-    def __init__(self, db_name: str = 'data/inspections.db', table_name: str = 'inspections'):
+    def __init__(self, db_name: str = 'data/inspections.db', table_name: str = 'inspections',
+                 bulk_batch_size: int = 10000):
         self.db_name = db_name
         self.table_name = table_name
+        self.bulk_batch_size = bulk_batch_size
+        self.meta_table = 'dataset_meta'
+        self.sync_state_table = 'sync_state'
+        # Итоги запусков загрузки (длительность, статус, срез метрик); храним последние runs_keep
+        self.runs_table = 'ingest_runs'
+        self.runs_keep = 500
+        # Ключи записей, уже полученных прерываемым запуском (run_id из scripts.checkpoint): переживают
+        # перезапуск процесса, чтобы продолженная полная выгрузка удалила только действительно пропавшие записи
+        self.staged_keys_table = 'ingest_staged_keys'
+        # Полнотекстовый индекс FTS5 (external content) по названию организации и цели проверки
+        self.fts_table = f'{table_name}_fts'
+        self.fts_columns = ('entity_name', 'purpose')
+        # Компактная схема: записи лежат в storage_table, повторяющиеся статусы и результаты —
+        # в справочниках (в записи только их id), даты — целые секунды epoch.
+        # table_name — представление с прежними текстовыми колонками, его читает веб-приложение
+        self.storage_table = f'{table_name}_data'
+        self.lookup_tables = {'status': f'{table_name}_statuses', 'result': f'{table_name}_results'}
+        # Поля записи на входе (словарь или кортеж парсера в этом порядке)
+        self.input_fields = ('entity_name', 'ogrn', 'purpose', 'status', 'change_reason', 'changed_at',
+                             'result', 'examStartDate')
+        # Колонки storage_table — в том же порядке, что и input_fields
         self.columns = [
             ('entity_name', 'TEXT'),
             ('ogrn', 'TEXT'),
             ('purpose', 'TEXT'),
-            ('status', 'TEXT'),
-            ('result', 'TEXT'),
-            ('examStartDate', 'TEXT')
+            ('status_id', 'INTEGER NOT NULL'),
+            ('change_reason', 'TEXT'),
+            ('changed_at', 'INTEGER'),
+            ('result_id', 'INTEGER NOT NULL'),
+            ('exam_start', 'INTEGER')
         ]
+        # Естественный ключ проверки: id из API, а если его нет — хэш содержимого
+        self.key_column = 'record_key'
+        self.external_id_field = 'external_id'
+        # Сводки для /stats, их поддерживают триггеры на storage_table: число проверок по дню начала
+        # (без даты — день -1), статусу и результату; по организации (ОГРН) — всего, с нарушениями и без
+        self.daily_rollup = f'{table_name}_daily'
+        self.org_rollup = f'{table_name}_by_org'
+        # Кэш id справочников (имя -> id), заполняется из БД в начале каждой загрузки
+        self._lookup_ids: Dict[str, Dict[str, int]] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Открывает соединение в режиме WAL: читатели веб-приложения видят
+        последний закоммиченный снимок и не блокируются загрузкой.
+        """
+        conn = sqlite3.connect(self.db_name)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
 
-    def create_table(self, conn):
+    def create_table(self, conn, table_name: str = None):
+        """
+        Создаёт таблицу записей. Без table_name — всю схему: справочники, storage_table,
+        представление, индексы и полнотекстовый индекс (с миграцией старого формата).
+        """
         columns_sql = ', '.join([f'{name} {type_}' for name, type_ in self.columns])
-        sql = f'''CREATE TABLE IF NOT EXISTS {self.table_name} (
+        sql = f'''CREATE TABLE IF NOT EXISTS {table_name or self.storage_table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            {columns_sql}
+            {columns_sql},
+            {self.key_column} TEXT
         )'''
-        conn.execute(sql)
-        print(f"[INFO] Таблица {self.table_name} создана или уже существует.")
+        if table_name is None:
+            self.create_lookup_tables(conn)
+            self.create_meta_table(conn)
+            conn.execute(sql)
+            migrated = self.migrate_table(conn)
+            self.create_view(conn)
+            self.create_indexes(conn)
+            self.create_fts(conn)
+            self.create_rollups(conn)
+            conn.commit()
+            if migrated:
+                # Место, освобождённое текстовой таблицей, возвращаем файловой системе
+                conn.execute('VACUUM')
+                print("[INFO] База данных сжата после миграции.")
+            self.load_lookups(conn)
+        else:
+            conn.execute(sql)
+        print(f"[INFO] Таблица {table_name or self.storage_table} создана или уже существует.")
+
+    def create_lookup_tables(self, conn):
+        for table in self.lookup_tables.values():
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+
+    def load_lookups(self, conn):
+        self._lookup_ids = {
+            kind: dict(conn.execute(f'SELECT name, id FROM {table}').fetchall())
+            for kind, table in self.lookup_tables.items()
+        }
+
+    def lookup_id(self, conn, kind: str, name: str) -> int:
+        """id значения в справочнике; новое значение добавляется в ту же транзакцию, что и записи"""
+        ids = self._lookup_ids.setdefault(kind, {})
+        value_id = ids.get(name)
+        if value_id is None:
+            table = self.lookup_tables[kind]
+            conn.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (name,))
+            value_id = ids[name] = conn.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()[0]
+        return value_id
+
+    def create_view(self, conn):
+        """
+        Представление с колонками прежней текстовой таблицы: статус собирается обратно
+        вместе с ". Изменено. Основание: ...", дата — в ДД.ММ.ГГГГ и ISO (exam_date_iso).
+        Сырые колонки (exam_start, status_name, status_id, result_id) тоже доступны — по ним есть индексы.
+        """
+        statuses, results = self.lookup_tables['status'], self.lookup_tables['result']
+        conn.execute(f'''CREATE VIEW IF NOT EXISTS {self.table_name} AS
+            SELECT d.id, d.entity_name, d.ogrn, d.purpose,
+                rtrim(s.name || CASE WHEN d.change_reason <> '' OR d.changed_at IS NOT NULL
+                    THEN '. Изменено. Основание: ' || d.change_reason || ' Последнее изменение: '
+                        || coalesce(strftime('%d.%m.%Y %H:%M', d.changed_at, 'unixepoch'), '')
+                    ELSE '' END) AS status,
+                r.name AS result,
+                coalesce(strftime('%d.%m.%Y', d.exam_start, 'unixepoch'), '') AS examStartDate,
+                d.{self.key_column},
+                date(d.exam_start, 'unixepoch') AS exam_date_iso,
+                d.exam_start, s.name AS status_name, d.status_id, d.change_reason, d.changed_at, d.result_id
+            FROM {self.storage_table} d
+            JOIN {statuses} s ON s.id = d.status_id
+            JOIN {results} r ON r.id = d.result_id''')
+
+    def ensure_schema(self):
+        """Создаёт таблицу и индексы (с миграцией старого формата) без загрузки данных"""
+        conn = self.connect()
+        try:
+            self.create_table(conn)
+            self.create_runs_table(conn)
+            conn.commit()
+            if conn.execute(f'SELECT 1 FROM {self.meta_table}').fetchone() is None:
+                # Метаданных ещё нет (БД старого формата) — считаем их по текущим данным
+                self.write_metadata(conn, stamp=False)
+                conn.commit()
+        finally:
+            conn.close()
+
+    def create_sync_state_table(self, conn):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.sync_state_table} (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )''')
+
+    def get_sync_state(self) -> Dict[str, str]:
+        """Возвращает отметки синхронизации (last_edit_ts, last_sync_at, last_full_sync_at)"""
+        conn = self.connect()
+        try:
+            self.create_sync_state_table(conn)
+            return dict(conn.execute(f'SELECT key, value FROM {self.sync_state_table}').fetchall())
+        finally:
+            conn.close()
+
+    def save_sync_state(self, state: Dict[str, Any]):
+        conn = self.connect()
+        try:
+            self.create_sync_state_table(conn)
+            conn.executemany(
+                f'INSERT INTO {self.sync_state_table} (key, value) VALUES (?, ?) '
+                f'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                ((key, None if value is None else str(value)) for key, value in state.items())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def create_runs_table(self, conn):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.runs_table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            duration_sec REAL NOT NULL,
+            mode TEXT,
+            status TEXT NOT NULL,
+            items INTEGER NOT NULL,
+            metrics TEXT NOT NULL
+        )''')
+
+    def save_run(self, run: Dict[str, Any]):
+        """Сохраняет итог запуска загрузки; metrics — срез метрик (JSON-совместимый словарь)"""
+        conn = self.connect()
+        try:
+            self.create_runs_table(conn)
+            conn.execute(
+                f'INSERT INTO {self.runs_table} (started_at, finished_at, duration_sec, mode, status, items, metrics) '
+                f'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (run["started_at"], run["finished_at"], run["duration_sec"], run.get("mode"), run["status"],
+                 run.get("items", 0), json.dumps(run.get("metrics", {}), ensure_ascii=False))
+            )
+            conn.execute(
+                f'DELETE FROM {self.runs_table} WHERE id <= '
+                f'(SELECT id FROM {self.runs_table} ORDER BY id DESC LIMIT 1 OFFSET ?)', (self.runs_keep,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def create_staged_keys_table(self, conn, table_name: str = None):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table_name or self.staged_keys_table} (
+            run_id TEXT NOT NULL,
+            {self.key_column} TEXT NOT NULL,
+            PRIMARY KEY (run_id, {self.key_column})
+        ) WITHOUT ROWID''')
+
+    def clear_staged_keys(self, conn, run_id: Optional[str] = None):
+        """Удаляет ключи запуска run_id (без run_id — всех запусков)"""
+        self.create_staged_keys_table(conn)
+        if run_id is None:
+            conn.execute(f'DELETE FROM {self.staged_keys_table}')
+        else:
+            conn.execute(f'DELETE FROM {self.staged_keys_table} WHERE run_id = ?', (run_id,))
+
+    def create_meta_table(self, conn):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.meta_table} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            loaded_at TEXT,
+            status_counts TEXT NOT NULL
+        )''')
+
+    def write_metadata(self, conn, stamp: bool = True):
+        """
+        Пересчитывает метаданные набора (число строк, распределение статусов)
+        и увеличивает версию. Вызывается в той же транзакции, что и загрузка,
+        чтобы веб-приложению не приходилось считать COUNT(*) на каждый запрос.
+        """
+        loaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S') if stamp else None
+        row_count = conn.execute(f'SELECT COUNT(*) FROM {self.storage_table}').fetchone()[0]
+        # Основание изменения хранится отдельно, поэтому статусы считаются прямо по справочнику
+        status_counts = dict(conn.execute(
+            f'SELECT s.name, COUNT(*) FROM {self.storage_table} d '
+            f'JOIN {self.lookup_tables["status"]} s ON s.id = d.status_id '
+            f'GROUP BY d.status_id ORDER BY COUNT(*) DESC'
+        ).fetchall())
+        conn.execute(
+            f'''INSERT INTO {self.meta_table} (id, version, row_count, loaded_at, status_counts)
+            VALUES (1, 1, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET version = version + 1, row_count = excluded.row_count,
+                loaded_at = excluded.loaded_at, status_counts = excluded.status_counts''',
+            (row_count, loaded_at, json.dumps(status_counts, ensure_ascii=False))
+        )
+
+    def create_indexes(self, conn):
+        """
+        Создаёт индексы таблицы записей: ключ записи, keyset-пагинация
+        по сортировкам, точный поиск по ОГРН и фильтры по статусу и результату
+        """
+        conn.execute(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{self.storage_table}_{self.key_column} '
+            f'ON {self.storage_table} ({self.key_column})'
+        )
+        for column in ('exam_start', 'entity_name', 'ogrn', 'status_id', 'result_id'):
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_{self.storage_table}_{column} '
+                f'ON {self.storage_table} ({column}, id)'
+            )
+
+    def create_fts(self, conn):
+        """
+        Создаёт FTS5-индекс поверх таблицы записей (content=) и триггеры,
+        которые поддерживают его при вставке, обновлении и удалении строк.
+        Если индекс создаётся впервые (БД старого формата), он строится по текущим данным.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.fts_table,)
+        ).fetchone()
+        if not exists:
+            conn.execute(
+                f"CREATE VIRTUAL TABLE {self.fts_table} USING fts5("
+                f"{', '.join(self.fts_columns)}, content='{self.storage_table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            self.rebuild_fts(conn)
+            print(f"[INFO] Создан полнотекстовый индекс {self.fts_table}.")
+        self.create_fts_triggers(conn)
+
+    def create_fts_triggers(self, conn):
+        columns = ', '.join(self.fts_columns)
+        new_values = ', '.join(f'new.{name}' for name in self.fts_columns)
+        old_values = ', '.join(f'old.{name}' for name in self.fts_columns)
+        # Для external content удаление из индекса — служебная команда 'delete' со старыми значениями
+        delete_sql = (f"INSERT INTO {self.fts_table} ({self.fts_table}, rowid, {columns}) "
+                      f"VALUES ('delete', old.id, {old_values});")
+        insert_sql = f"INSERT INTO {self.fts_table} (rowid, {columns}) VALUES (new.id, {new_values});"
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ai AFTER INSERT ON {self.storage_table} '
+                     f'BEGIN {insert_sql} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad AFTER DELETE ON {self.storage_table} '
+                     f'BEGIN {delete_sql} END')
+        # Изменение статуса или результата индекс не трогает
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au '
+                     f'AFTER UPDATE OF {columns} ON {self.storage_table} '
+                     f'BEGIN {delete_sql} {insert_sql} END')
+
+    def create_rollups(self, conn):
+        """
+        Создаёт сводные таблицы и триггеры, которые обновляют их при каждой вставке,
+        изменении и удалении записи. Новые сводки (БД без них) заполняются по текущим данным.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.org_rollup,)
+        ).fetchone()
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.daily_rollup} (
+            day INTEGER NOT NULL,
+            status_id INTEGER NOT NULL,
+            result_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, status_id, result_id)
+        ) WITHOUT ROWID''')
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.org_rollup} (
+            ogrn TEXT PRIMARY KEY,
+            entity_name TEXT,
+            total INTEGER NOT NULL,
+            offences INTEGER NOT NULL,
+            no_offences INTEGER NOT NULL
+        )''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.org_rollup}_total ON {self.org_rollup} (total)')
+        if not exists:
+            self.rebuild_rollups(conn)
+            print(f"[INFO] Созданы сводные таблицы {self.daily_rollup}, {self.org_rollup}.")
+        else:
+            # Триггеры прежних версий считали записи без ОГРН одной «организацией» — заменяем их
+            trigger_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                (f'{self.storage_table}_rollup_ai',)
+            ).fetchone()
+            if trigger_sql and "<> ''" not in trigger_sql[0]:
+                for suffix in ('ai', 'ad', 'au'):
+                    conn.execute(f'DROP TRIGGER IF EXISTS {self.storage_table}_rollup_{suffix}')
+                conn.execute(f"DELETE FROM {self.org_rollup} WHERE ogrn = '' OR ogrn IS NULL")
+        self.create_rollup_triggers(conn)
+
+    def result_flag_sql(self, result_id: str, name: str) -> str:
+        """SQL-выражение 1/0: совпадает ли результат с id result_id со значением name"""
+        return (f"coalesce((SELECT name FROM {self.lookup_tables['result']} WHERE id = {result_id}) = "
+                f"'{name.replace(chr(39), chr(39) * 2)}', 0)")
+
+    def create_rollup_triggers(self, conn):
+        # Записи без ОГРН (пустой ogrn) в сводку по организациям не попадают: это не одна организация
+        def add(row: str) -> str:
+            return (
+                f"INSERT INTO {self.daily_rollup} (day, status_id, result_id, count) "
+                f"VALUES (coalesce({row}.exam_start, -1), {row}.status_id, {row}.result_id, 1) "
+                f"ON CONFLICT(day, status_id, result_id) DO UPDATE SET count = count + 1; "
+                f"INSERT INTO {self.org_rollup} (ogrn, entity_name, total, offences, no_offences) "
+                f"SELECT {row}.ogrn, {row}.entity_name, 1, {self.result_flag_sql(f'{row}.result_id', OFFENCE_FOUND)}, "
+                f"{self.result_flag_sql(f'{row}.result_id', OFFENCE_NOT_FOUND)} WHERE {row}.ogrn <> '' "
+                f"ON CONFLICT(ogrn) DO UPDATE SET total = total + 1, offences = offences + excluded.offences, "
+                f"no_offences = no_offences + excluded.no_offences, entity_name = excluded.entity_name;"
+            )
+
+        def remove(row: str) -> str:
+            day_key = (f"day = coalesce({row}.exam_start, -1) AND status_id = {row}.status_id "
+                       f"AND result_id = {row}.result_id")
+            return (
+                f"UPDATE {self.daily_rollup} SET count = count - 1 WHERE {day_key}; "
+                f"DELETE FROM {self.daily_rollup} WHERE {day_key} AND count <= 0; "
+                f"UPDATE {self.org_rollup} SET total = total - 1, "
+                f"offences = offences - {self.result_flag_sql(f'{row}.result_id', OFFENCE_FOUND)}, "
+                f"no_offences = no_offences - {self.result_flag_sql(f'{row}.result_id', OFFENCE_NOT_FOUND)} "
+                f"WHERE ogrn = {row}.ogrn; "
+                f"DELETE FROM {self.org_rollup} WHERE ogrn = {row}.ogrn AND total <= 0;"
+            )
+
+        columns = ('ogrn', 'status_id', 'result_id', 'exam_start')
+        changed = ' OR '.join(f'old.{name} IS NOT new.{name}' for name in columns)
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.storage_table}_rollup_ai '
+                     f'AFTER INSERT ON {self.storage_table} BEGIN {add("new")} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.storage_table}_rollup_ad '
+                     f'AFTER DELETE ON {self.storage_table} BEGIN {remove("old")} END')
+        # Переименование организации сводку не трогает — название обновится при следующей вставке
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.storage_table}_rollup_au '
+                     f'AFTER UPDATE OF {", ".join(columns)} ON {self.storage_table} WHEN {changed} '
+                     f'BEGIN {remove("old")} {add("new")} END')
+
+    def rebuild_rollups(self, conn):
+        """Пересчитывает сводки целиком по таблице записей (после подмены теневой таблицы и при создании)"""
+        conn.execute(f'DELETE FROM {self.daily_rollup}')
+        conn.execute(
+            f'INSERT INTO {self.daily_rollup} (day, status_id, result_id, count) '
+            f'SELECT coalesce(exam_start, -1), status_id, result_id, COUNT(*) FROM {self.storage_table} '
+            f'GROUP BY 1, 2, 3'
+        )
+        conn.execute(f'DELETE FROM {self.org_rollup}')
+        conn.execute(
+            f'INSERT INTO {self.org_rollup} (ogrn, entity_name, total, offences, no_offences) '
+            f'SELECT d.ogrn, max(d.entity_name), COUNT(*), coalesce(SUM(r.name = ?), 0), coalesce(SUM(r.name = ?), 0) '
+            f'FROM {self.storage_table} d JOIN {self.lookup_tables["result"]} r ON r.id = d.result_id '
+            f"WHERE d.ogrn <> '' GROUP BY d.ogrn",
+            (OFFENCE_FOUND, OFFENCE_NOT_FOUND)
+        )
+
+    def rebuild_fts(self, conn):
+        """Перестраивает полнотекстовый индекс целиком по содержимому основной таблицы"""
+        conn.execute(f"INSERT INTO {self.fts_table} ({self.fts_table}) VALUES ('rebuild')")
+
+    def migrate_table(self, conn) -> bool:
+        """
+        Переносит данные из текстовой таблицы старого формата (table_name — таблица, а не
+        представление) в компактную storage_table: id и ключи записей сохраняются, статус
+        раскладывается на справочник и основание/время изменения, даты переводятся в epoch.
+        Старая таблица и её полнотекстовый индекс удаляются. Возвращает True, если миграция была.
+        """
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (self.table_name,)).fetchone()
+        if not kind or kind[0] != 'table':
+            return False
+        existing = [row[1] for row in conn.execute(f'PRAGMA table_xinfo({self.table_name})')]
+        legacy_columns = ['entity_name', 'ogrn', 'purpose', 'status', 'result', 'examStartDate']
+        has_key = self.key_column in existing
+        self.load_lookups(conn)
+        cur = conn.execute(
+            f'SELECT id, {", ".join(legacy_columns)}{f", {self.key_column}" if has_key else ""} '
+            f'FROM {self.table_name} ORDER BY id'
+        )
+        sql = self.get_insert_sql(with_id=True)
+        occurrences = {}
+        total = 0
+        while True:
+            rows = cur.fetchmany(self.bulk_batch_size)
+            if not rows:
+                break
+            encoded = []
+            for row in rows:
+                entity_name, ogrn, purpose, status, result, exam_start = (value or '' for value in row[1:7])
+                # Ключи старых записей без колонки record_key считаются так же, как считались раньше
+                key = row[7] if has_key else self.make_record_key(
+                    (entity_name, ogrn, purpose, status, result, exam_start), None, occurrences)
+                status, change_reason, changed_at = split_legacy_status(status)
+                encoded.append((row[0],) + self.encode_values(
+                    conn, (entity_name, ogrn, purpose, status, change_reason, changed_at, result, exam_start)
+                ) + (key,))
+            conn.executemany(sql, encoded)
+            total += len(encoded)
+        cur.close()
+        # Триггеры и индексы старой таблицы удаляются вместе с ней
+        conn.execute(f'DROP TABLE IF EXISTS {self.fts_table}')
+        conn.execute(f'DROP TABLE {self.table_name}')
+        print(f"[INFO] Таблица {self.table_name} переведена в компактный формат ({self.storage_table}): {total} записей.")
+        return True
+
+    def make_record_key(self, values: tuple, external_id: Any, occurrences: Dict[str, int]) -> str:
+        """
+        Ключ записи. Если API отдал id проверки — используем его. Иначе берём хэш
+        всех полей с порядковым номером повтора, чтобы одинаковые записи не схлопывались.
+        occurrences — счётчик повторов в рамках одной загрузки.
+        """
+        if external_id:
+            return f'ext:{external_id}'
+        raw = '\x1f'.join(str(value) for value in values)
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        n = occurrences.get(digest, 0)
+        occurrences[digest] = n + 1
+        return f'{digest}:{n}'
+
+    def row_values(self, conn, item, occurrences: Dict[str, int]) -> tuple:
+        """
+        Строка для INSERT. item — словарь или кортеж в порядке self.input_fields
+        (необязательный последний элемент — external_id), как отдаёт пакетный разбор парсера.
+        """
+        n = len(self.input_fields)
+        if isinstance(item, tuple):
+            raw = item[:n]
+            external_id = item[n] if len(item) > n else None
+        else:
+            raw = tuple(item.get(name) for name in self.input_fields)
+            external_id = item.get(self.external_id_field)
+        # changed_at — число (секунды epoch) или None, остальные поля — строки
+        values = tuple(value or None if name == 'changed_at' else value or ''
+                       for name, value in zip(self.input_fields, raw))
+        return self.encode_values(conn, values) + (self.make_record_key(values, external_id, occurrences),)
+
+    def encode_values(self, conn, values: tuple) -> tuple:
+        """Поля в порядке input_fields -> колонки storage_table: id справочников и дата в epoch"""
+        entity_name, ogrn, purpose, status, change_reason, changed_at, result, exam_start = values
+        return (entity_name, ogrn, purpose, self.lookup_id(conn, 'status', status), change_reason,
+                changed_at, self.lookup_id(conn, 'result', result), date_to_epoch(exam_start))
+
+    def get_insert_sql(self, table_name: str = None, with_id: bool = False) -> str:
+        names = (['id'] if with_id else []) + [name for name, _ in self.columns] + [self.key_column]
+        placeholders = ', '.join(['?'] * len(names))
+        return f'INSERT INTO {table_name or self.storage_table} ({", ".join(names)}) VALUES ({placeholders})'
+
+    def get_upsert_sql(self) -> str:
+        """INSERT ... ON CONFLICT, который не трогает строку, если данные не изменились"""
+        names = [name for name, _ in self.columns]
+        updates = ', '.join(f'{name} = excluded.{name}' for name in names)
+        changed = ' OR '.join(f'{name} IS NOT excluded.{name}' for name in names)
+        return (
+            f'{self.get_insert_sql()} '
+            f'ON CONFLICT({self.key_column}) DO UPDATE SET {updates} WHERE {changed}'
+        )
 
     def insert_data_from_list(self, data: List[Dict[str, Any]]):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.connect()
         self.create_table(conn)
         # Очищаем таблицу перед загрузкой новых данных
-        conn.execute(f'DELETE FROM {self.table_name}')
+        conn.execute(f'DELETE FROM {self.storage_table}')
         print(f"[INFO] Старые данные удалены из таблицы {self.table_name}.")
-        placeholders = ', '.join(['?'] * len(self.columns))
-        columns = ', '.join([name for name, _ in self.columns])
-        sql = f'INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})'
+        sql = self.get_upsert_sql()
+        occurrences = {}
         cur = conn.cursor()
         for item in data:
-            values = tuple(item.get(name, '') for name, _ in self.columns)
-            cur.execute(sql, values)
+            cur.execute(sql, self.row_values(conn, item, occurrences))
+        self.write_metadata(conn)
         conn.commit()
         print(f"[INFO] Вставлено {len(data)} записей в таблицу {self.table_name}.")
-        conn.close() 
\ No newline at end of file
+        conn.close()
+
+    def insert_batches(self, batches: Iterable[List[Dict[str, Any]]]) -> int:
+        """
+        Потоковая загрузка: каждая пачка записывается и коммитится сразу после получения.
+        Старые данные удаляются только при поступлении первой непустой пачки,
+        чтобы неудачный запуск не оставил таблицу пустой.
+        """
+        conn = self.connect()
+        try:
+            self.create_table(conn)
+            sql = self.get_upsert_sql()
+            occurrences = {}
+            total = 0
+            cleared = False
+            for batch in batches:
+                if not batch:
+                    continue
+                if not cleared:
+                    conn.execute(f'DELETE FROM {self.storage_table}')
+                    print(f"[INFO] Старые данные удалены из таблицы {self.table_name}.")
+                    cleared = True
+                with LOADER_BATCH_SECONDS.time(mode='replace'):
+                    # Строки собираются заранее: новые значения справочников вставляются тем же соединением
+                    conn.executemany(sql, [self.row_values(conn, item, occurrences) for item in batch])
+                    conn.commit()
+                LOADER_ROWS.inc(len(batch), mode='replace')
+                total += len(batch)
+            if total:
+                with LOADER_FINALIZE_SECONDS.time(mode='replace'):
+                    self.write_metadata(conn)
+                    conn.commit()
+            print(f"[INFO] Вставлено {total} записей в таблицу {self.table_name}.")
+            return total
+        finally:
+            conn.close()
+
+    def upsert_batches(self, batches: Iterable[List[Dict[str, Any]]],
+                       is_complete: Optional[Callable[[], bool]] = None, run_id: Optional[str] = None) -> int:
+        """
+        Инкрементальная загрузка по ключу record_key: новые записи вставляются,
+        изменившиеся обновляются на месте (id сохраняется), неизменные не трогаются.
+        Записи, которых больше нет в выгрузке, удаляются в конце загрузки —
+        только если is_complete() подтверждает, что выгрузка полная.
+        run_id — запуск с контрольными точками: полученные ключи копятся в staged_keys_table
+        вместе с пачками, и продолженный после сбоя запуск учитывает ключи прежних попыток.
+        """
+        conn = self.connect()
+        try:
+            self.create_table(conn)
+            # Без контрольных точек ключи живут только в соединении (временная таблица)
+            seen_table = 'temp.seen_keys' if run_id is None else self.staged_keys_table
+            self.create_staged_keys_table(conn, seen_table)
+            seen_run = run_id or ''
+            # Изменения прерванных попыток уже закоммичены, а версия после них не увеличивалась
+            resumed = run_id is not None and conn.execute(
+                f'SELECT 1 FROM {seen_table} WHERE run_id = ? LIMIT 1', (seen_run,)).fetchone() is not None
+            sql = self.get_upsert_sql()
+            occurrences = {}
+            total = 0
+            changed = 0
+            for batch in batches:
+                if not batch:
+                    continue
+                with LOADER_BATCH_SECONDS.time(mode='upsert'):
+                    rows = [self.row_values(conn, item, occurrences) for item in batch]
+                    conn.executemany(f'INSERT OR IGNORE INTO {seen_table} VALUES (?, ?)',
+                                     ((seen_run, row[-1]) for row in rows))
+                    # rowcount не учитывает изменения, сделанные триггерами полнотекстового индекса
+                    changed += conn.executemany(sql, rows).rowcount
+                    conn.commit()
+                LOADER_ROWS.inc(len(rows), mode='upsert')
+                total += len(rows)
+
+            # Продолженный запуск мог получить все записи в прошлых попытках — тогда завершаем загрузку по ним
+            if not total and not resumed:
+                print(f"[INFO] Нет данных для загрузки в таблицу {self.table_name}.")
+                return 0
+
+            finalize_started = time.perf_counter()
+            if is_complete is None or is_complete():
+                cur = conn.execute(
+                    f'DELETE FROM {self.storage_table} WHERE {self.key_column} NOT IN '
+                    f'(SELECT {self.key_column} FROM {seen_table} WHERE run_id = ?)', (seen_run,)
+                )
+                deleted = cur.rowcount
+            else:
+                print("[WARNING] Выгрузка неполная — отсутствующие записи не удаляются.")
+                deleted = 0
+            # Версия растёт только при изменении данных: иначе каждая пустая синхронизация
+            # сбрасывала бы ETag и кэш ответов веб-приложения
+            if changed or deleted or resumed:
+                self.write_metadata(conn)
+            conn.commit()
+            LOADER_FINALIZE_SECONDS.observe(time.perf_counter() - finalize_started, mode='upsert')
+            print(f"[INFO] Обновление {self.table_name}: получено {total}, "
+                  f"вставлено/изменено {changed}, удалено {deleted}.")
+            return total
+        finally:
+            conn.close()
+
+    def swap_batches(self, batches: Iterable[List[Dict[str, Any]]]) -> int:
+        """
+        Полная перезагрузка через теневую таблицу: записи вставляются пачками
+        по bulk_batch_size через executemany, затем одной транзакцией теневая
+        таблица подменяет основную. Читатели всегда видят полный снимок данных.
+        """
+        shadow = f'{self.storage_table}_shadow'
+        conn = self.connect()
+        try:
+            self.create_table(conn)
+            conn.execute(f'DROP TABLE IF EXISTS {shadow}')
+            self.create_table(conn, shadow)
+            # Уникальность ключа нужна и в теневой таблице: повторы (например, один id
+            # на двух страницах) отбрасываются при вставке, а не ломают подмену
+            conn.execute(f'CREATE UNIQUE INDEX idx_{shadow}_{self.key_column} ON {shadow} ({self.key_column})')
+            sql = self.get_insert_sql(shadow).replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1)
+            occurrences = {}
+            buffer = []
+            total = 0
+            for batch in batches:
+                buffer.extend(self.row_values(conn, item, occurrences) for item in batch)
+                if len(buffer) >= self.bulk_batch_size:
+                    with LOADER_BATCH_SECONDS.time(mode='swap'):
+                        conn.executemany(sql, buffer)
+                    LOADER_ROWS.inc(len(buffer), mode='swap')
+                    total += len(buffer)
+                    buffer = []
+            if buffer:
+                with LOADER_BATCH_SECONDS.time(mode='swap'):
+                    conn.executemany(sql, buffer)
+                LOADER_ROWS.inc(len(buffer), mode='swap')
+                total += len(buffer)
+            conn.commit()
+
+            if not total:
+                conn.execute(f'DROP TABLE IF EXISTS {shadow}')
+                conn.commit()
+                print(f"[INFO] Нет данных для загрузки, таблица {self.table_name} не изменена.")
+                return 0
+
+            finalize_started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            # Представление снимается на время подмены: RENAME не допускает ссылок на отсутствующую таблицу
+            conn.execute(f'DROP VIEW {self.table_name}')
+            conn.execute(f'DROP TABLE {self.storage_table}')
+            conn.execute(f'ALTER TABLE {shadow} RENAME TO {self.storage_table}')
+            # У индекса теневой таблицы осталось её имя — пересоздаём под каноническим
+            conn.execute(f'DROP INDEX IF EXISTS idx_{shadow}_{self.key_column}')
+            self.create_view(conn)
+            self.create_indexes(conn)
+            # Теневая таблица заполнялась без триггеров — полнотекстовый индекс и сводки строим одним проходом
+            self.create_fts_triggers(conn)
+            self.rebuild_fts(conn)
+            self.create_rollup_triggers(conn)
+            self.rebuild_rollups(conn)
+            self.write_metadata(conn)
+            conn.commit()
+            LOADER_FINALIZE_SECONDS.observe(time.perf_counter() - finalize_started, mode='swap')
+            print(f"[INFO] Таблица {self.table_name} заменена: {total} записей.")
+            return total
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
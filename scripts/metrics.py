@@ -0,0 +1,189 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм по умолчанию (секунды): от миллисекунд до минуты
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """Базовый класс метрики с метками: значения хранятся по кортежу значений меток"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def label_key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, key)), "value": value}
+                    for key, value in self._values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": self.type_name, "help": self.documentation, "samples": self.samples()}
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self.label_key(labels)] = value
+
+
+class Histogram(Metric):
+    """Гистограмма с накопительными корзинами, как в Prometheus (le — верхняя граница)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with и записывает её в гистограмму"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"labels": dict(zip(self.labelnames, key)), "buckets": list(state["buckets"]),
+                     "sum": state["sum"], "count": state["count"]}
+                    for key, state in self._values.items()]
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = super().snapshot()
+        snapshot["bounds"] = list(self.buckets)
+        return snapshot
+
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса. snapshot() — JSON-совместимый срез (его можно сохранить
+    в БД вместе с итогом запуска), render() — текстовый формат Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        """Обнуляет все метрики (например, перед очередным запуском загрузки)"""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+def gauge_snapshot(documentation: str, value: float, **labels) -> Dict[str, Any]:
+    """Срез одиночного gauge — для значений, которые не хранятся в реестре (например, прочитанных из БД)"""
+    return {"type": 'gauge', "help": documentation, "samples": [{"labels": labels, "value": value}]}
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Dict[str, Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def render_snapshot(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """Текстовый формат Prometheus (exposition format 0.0.4) для среза метрик"""
+    lines = []
+    for name, family in snapshot.items():
+        lines.append(f'# HELP {name} {family["help"]}')
+        lines.append(f'# TYPE {name} {family["type"]}')
+        for sample in family["samples"]:
+            labels = sample["labels"]
+            if family["type"] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(family["bounds"], sample["buckets"]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, ("le", format_value(float(bound))))} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels, ("le", "+Inf"))} {sample["count"]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(float(sample["sum"]))}')
+                lines.append(f'{name}_count{format_labels(labels)} {sample["count"]}')
+            else:
+                lines.append(f'{name}{format_labels(labels)} {format_value(sample["value"])}')
+    return '\n'.join(lines) + '\n'
+
+
+# Метрики загрузки (парсер, загрузчик) и веб-приложения живут в разных процессах,
+# поэтому и реестры раздельные: срез загрузки сохраняется в БД после каждого запуска
+ingest_registry = MetricsRegistry()
+web_registry = MetricsRegistry()
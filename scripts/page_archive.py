@@ -0,0 +1,59 @@
+import gzip
+import json
+import hashlib
+import os
+import threading
+import logging
+from typing import Any, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_query_key(url: str, payload: Dict[str, Any]) -> str:
+    """Короткий ключ запроса (URL + тело) — по нему различаются страницы разных окон поиска"""
+    raw = url + json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+class PageArchiveWriter:
+    """
+    Архив сырых ответов API: сжатый gzip NDJSON, одна строка на страницу
+    вида {"key": ..., "page": N, "data": {...}}. Потокобезопасен — один
+    писатель можно отдать нескольким парсерам (шардам, потокам).
+    """
+
+    def __init__(self, path: str, compresslevel: int = 6):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(path, 'at', encoding='utf-8', compresslevel=compresslevel)
+        self._lock = threading.Lock()
+        self.pages = 0
+
+    def write(self, key: str, page: int, data: Dict[str, Any]):
+        line = json.dumps({"key": key, "page": page, "data": data}, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self.pages += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        logger.info(f"Архив {self.path}: записано страниц {self.pages}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_archive(path: str) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    """Читает архив построчно — в памяти одна страница за раз"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record["key"], record["page"], record["data"]
@@ -0,0 +1,107 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from scripts.metrics import ingest_registry
+
+logger = logging.getLogger(__name__)
+
+RATE_GAUGE = ingest_registry.gauge('inspections_rate_limit_rps', 'Текущий допустимый темп запросов к API, запросов/с')
+PAUSES_TOTAL = ingest_registry.counter(
+    'inspections_rate_limit_pauses_total', 'Общие паузы запросов после 429/5xx/таймаутов')
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах: число секунд или HTTP-дата; None — заголовка нет или он некорректен"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Общий для всех потоков ограничитель темпа запросов (token bucket с AIMD-регулировкой).
+
+    Пока API отвечает успешно, темп растёт: до порога — в (1 + increase_ratio) раз на ответ
+    (медленный старт), выше порога — на increase_step запросов/с. На 429/5xx/таймаут
+    темп уменьшается в decrease_factor раз (не чаще раза в cooldown секунд — чтобы
+    одна перегрузка, замеченная сразу несколькими потоками, не обвалила темп многократно),
+    а все потоки ставятся на общую паузу — по Retry-After, если он есть.
+    """
+
+    def __init__(self, initial_rate: float = 2.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 increase_ratio: float = 0.1, increase_step: float = 0.05, decrease_factor: float = 0.5,
+                 burst: float = 1.0, cooldown: float = 1.0, max_pause: float = 120.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_ratio = increase_ratio
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        # Граница медленного старта: после первой перегрузки — половина темпа, на котором она случилась
+        self.threshold = max_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+        RATE_GAUGE.set(self.rate)
+
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Блокирует поток, пока не наступит его очередь отправить запрос.
+        False — ожидание прервано событием stop (запрос отправлять не нужно).
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - max(self.updated, self.paused_until)) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    wait = (1 - self.tokens) / self.rate
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.threshold:
+                self.rate = min(self.threshold, self.max_rate, self.rate * (1 + self.increase_ratio))
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+            RATE_GAUGE.set(self.rate)
+
+    def on_throttle(self, pause: float):
+        """Перегрузка или сбой API: снижает темп и ставит все потоки на паузу pause секунд"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.threshold = self.rate
+                self.last_decrease = now
+                logger.warning(f"Темп запросов снижен до {self.rate:.2f} запросов/с")
+                RATE_GAUGE.set(self.rate)
+            pause = min(max(pause, 0.0), self.max_pause)
+            if now + pause > self.paused_until:
+                self.paused_until = now + pause
+                self.tokens = 0.0
+                PAUSES_TOTAL.inc()
@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+import functools
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from scripts.metrics import web_registry
+
+CACHE_RESULTS = web_registry.counter(
+    'inspections_response_cache_total', 'Ответы по результату кэша (hit, miss, not_modified)', ('result',))
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Условные GET и LRU-кэш готовых ответов, привязанные к версии набора данных.
+
+    ETag строится из версии из dataset_meta, Last-Modified — из времени загрузки,
+    поэтому между обновлениями клиенты получают 304. Тела ответов кэшируются
+    по (версия, путь, параметры запроса): повторные запросы не обращаются к БД.
+    Загрузку ведёт другой процесс, поэтому кэш сбрасывается, как только
+    в dataset_meta появляется новая версия.
+    """
+
+    def __init__(self, meta, maxsize: int = 256):
+        self.meta = meta
+        self.maxsize = maxsize
+        # Токен запуска: после перезапуска (новые шаблоны) ETag меняется при той же версии данных
+        self.instance = format(int(time.time()), 'x')
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def clear(self):
+        """Сбрасывает кэш ответов"""
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key: tuple) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key: tuple, entry: tuple):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def validators(self, meta: Dict[str, Any]) -> Dict[str, str]:
+        """Заголовки ETag/Last-Modified/Cache-Control для текущей версии данных"""
+        headers = {
+            'ETag': f'W/"{meta["version"]}.{self.instance}"',
+            # Клиент может хранить ответ, но перед использованием обязан перепроверить его
+            'Cache-Control': 'no-cache',
+        }
+        if meta.get("loaded_at"):
+            # loaded_at записан загрузчиком в локальном времени сервера
+            loaded = datetime.strptime(meta["loaded_at"], '%Y-%m-%d %H:%M:%S').astimezone()
+            headers['Last-Modified'] = format_datetime(loaded, usegmt=True)
+        return headers
+
+    @staticmethod
+    def is_not_modified(request, headers: Dict[str, str]) -> bool:
+        """Проверка If-None-Match, а при его отсутствии — If-Modified-Since"""
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or headers['ETag'] in tags or headers['ETag'][2:] in tags
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since and 'Last-Modified' in headers:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(headers['Last-Modified'])
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _decorate(self, route, store: bool):
+        @functools.wraps(route)
+        async def wrapper(*args, **kwargs):
+            request = kwargs['request']
+            meta = await self.meta.get()
+            if meta["version"] != self._version:
+                if self._version is not None:
+                    logger.info(f"Версия данных {meta['version']}: кэш ответов сброшен")
+                self.clear()
+                self._version = meta["version"]
+            headers = self.validators(meta)
+            if self.is_not_modified(request, headers):
+                CACHE_RESULTS.inc(result='not_modified')
+                return Response(status_code=304, headers=headers)
+
+            key = (meta["version"], request.url.path, tuple(sorted(request.query_params.multi_items())))
+            entry = self._get(key) if store else None
+            if entry is not None:
+                CACHE_RESULTS.inc(result='hit')
+                body, media_type = entry
+                return Response(content=body, media_type=media_type, headers=headers)
+
+            response = await route(*args, **kwargs)
+            if not isinstance(response, Response):
+                response = JSONResponse(content=jsonable_encoder(response))
+            if response.status_code != 200:
+                return response
+            response.headers.update(headers)
+            if store:
+                CACHE_RESULTS.inc(result='miss')
+                self._put(key, (response.body, response.media_type))
+            return response
+        return wrapper
+
+    def cached(self, route):
+        """
+        Декоратор маршрута: 304 по валидаторам и кэш тела ответа.
+        У маршрута должен быть параметр request.
+        """
+        return self._decorate(route, store=True)
+
+    def conditional(self, route):
+        """Декоратор для потоковых ответов: только 304 и заголовки, тело не кэшируется"""
+        return self._decorate(route, store=False)
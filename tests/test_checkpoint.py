@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scripts.checkpoint import RunCheckpoint
+from scripts.fake_api import FakeSearchAPI
+from scripts.inspections_parser import GosuslugiInspectionsParser, ShardedInspectionsParser, stream_to_sqlite
+
+WINDOW = (datetime(2025, 7, 1, tzinfo=timezone.utc), datetime(2025, 8, 1, tzinfo=timezone.utc))
+PLAN = {"start": WINDOW[0], "end": WINDOW[1], "full": True, "changed_since": None}
+WORKERS = 4
+STALE_ROW = {"entity_name": "Удалённая", "ogrn": "1", "purpose": "p", "status": "", "result": "",
+             "examStartDate": "01.07.2025", "external_id": "stale-1"}
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture(scope='module')
+def api():
+    # 6000 записей при max_pages=3: окно делится на половины, а те — ещё раз
+    with FakeSearchAPI(items_count=6000) as server:
+        yield server
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Полученные страницы: (ключ запроса, страница)"""
+    pages = []
+    fetch_page = GosuslugiInspectionsParser.fetch_page
+
+    def recorded(self, page):
+        data = fetch_page(self, page)
+        if data:
+            pages.append((self.checkpoint_key(), page))
+        return data
+    monkeypatch.setattr(GosuslugiInspectionsParser, 'fetch_page', recorded)
+    return pages
+
+
+def make_parser(api, checkpoint):
+    return ShardedInspectionsParser(headers={}, start=WINDOW[0], end=WINDOW[1], max_pages=3, max_workers=WORKERS,
+                                    api_url=api.url, checkpoint=checkpoint, as_tuples=True)
+
+
+def crash_after(batches, count):
+    for number, batch in enumerate(batches):
+        if number == count:
+            raise Crash()
+        yield batch
+
+
+def load(db_path, batches, parser, checkpoint):
+    return stream_to_sqlite(batches, db_path=db_path, mode='upsert',
+                            is_complete=lambda: parser.completed, run_id=checkpoint.run_id)
+
+
+def new_db(tmp_path, name):
+    db_path = str(tmp_path / name)
+    stream_to_sqlite(iter([[STALE_ROW]]), db_path=db_path, mode='upsert')
+    return db_path
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT entity_name, ogrn, purpose, status, result, examStartDate, record_key '
+                            'FROM inspections ORDER BY record_key').fetchall()
+    finally:
+        conn.close()
+
+
+def full_run(api, tmp_path, fetched):
+    db_path = new_db(tmp_path, 'reference.db')
+    checkpoint = RunCheckpoint.start(db_path, PLAN)
+    parser = make_parser(api, checkpoint)
+    load(db_path, parser.iter_batches(), parser, checkpoint)
+    assert parser.completed
+    checkpoint.finish()
+    pages = set(fetched)
+    fetched.clear()
+    return rows(db_path), pages
+
+
+@pytest.mark.parametrize('crash_at', [0, 1, 3, 5])
+def test_interrupted_sharded_run_resumes_from_written_pages(api, tmp_path, fetched, crash_at):
+    reference_rows, reference_pages = full_run(api, tmp_path, fetched)
+    assert len(reference_rows) == 6000
+
+    db_path = new_db(tmp_path, 'inspections.db')
+    checkpoint = RunCheckpoint.start(db_path, PLAN)
+    parser = make_parser(api, checkpoint)
+    with pytest.raises(Crash):
+        load(db_path, crash_after(parser.iter_batches(), crash_at), parser, checkpoint)
+    assert not parser.completed
+
+    resumed = RunCheckpoint.resume(db_path, max_age=timedelta(hours=1))
+    assert resumed.run_id == checkpoint.run_id and resumed.plan == PLAN
+    # Записанными считаются страницы не дальше контрольной точки своего запроса
+    # (у разделённого подокна — все: продолженный запуск сразу переходит к половинам)
+    written = {(key, page) for key, page in fetched if page < resumed.next_page(key)}
+    assert len(written) >= crash_at
+    first_run = set(fetched)
+    fetched.clear()
+
+    parser = make_parser(api, resumed)
+    load(db_path, parser.iter_batches(), parser, resumed)
+    assert parser.completed
+    resumed.finish()
+
+    # Записанные страницы не запрашиваются снова, и ни одна страница не пропущена
+    assert not written & set(fetched)
+    # Повторно запрашиваются только страницы, которые были в работе в момент сбоя, и та, что не дописалась
+    assert len(first_run & set(fetched)) <= WORKERS + 1
+    assert written | set(fetched) == reference_pages
+    # Удаление отсутствующих учитывает записи обеих частей запуска
+    assert rows(db_path) == reference_rows
+    assert RunCheckpoint.resume(db_path, max_age=timedelta(hours=1)) is None
+
+
+def test_failed_load_keeps_checkpoint(api, tmp_path):
+    db_path = new_db(tmp_path, 'inspections.db')
+    checkpoint = RunCheckpoint.start(db_path, PLAN)
+    parser = make_parser(api, checkpoint)
+    with pytest.raises(Crash):
+        load(db_path, crash_after(parser.iter_batches(), 2), parser, checkpoint)
+
+    resumed = RunCheckpoint.resume(db_path, max_age=timedelta(hours=1))
+    assert resumed is not None and resumed.resumed_pages >= 2
+    # Отсутствующие записи не удаляются по неполной выгрузке
+    assert ('Удалённая',) in [row[:1] for row in rows(db_path)]
+
+
+def test_next_page_per_query_and_stale_run(tmp_path):
+    db_path = str(tmp_path / 'inspections.db')
+    checkpoint = RunCheckpoint.start(db_path, PLAN)
+    checkpoint.commit_page('a', 2)
+    checkpoint.commit_page('b', 1, done=True)
+
+    resumed = RunCheckpoint.resume(db_path, max_age=timedelta(hours=1))
+    assert (resumed.next_page('a'), resumed.is_done('a')) == (3, False)
+    assert (resumed.next_page('b'), resumed.is_done('b')) == (2, True)
+    assert resumed.next_page('c') == 1
+    # Страница записывается не дальше уже записанной
+    resumed.commit_page('a', 1)
+    assert resumed.next_page('a') == 3
+
+    # Запуск старше max_age отбрасывается
+    assert RunCheckpoint.resume(db_path, max_age=timedelta(0)) is None
+    assert RunCheckpoint.resume(db_path, max_age=timedelta(hours=1)) is None
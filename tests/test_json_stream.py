@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from scripts.json_stream import iter_object_items, make_projector
+
+DOCUMENTS = [
+    '{"items": [], "total": 0}',
+    '{}',
+    '{"total": 3, "items": [1, -2.5e-3, 123456789]}',
+    '{"items": [{"a": "кириллица", "b": "\\u0416\\ud83d\\ude00 \\"кавычки\\" \\\\ \\n\\t\\/"}, '
+    '{"c": [true, false, null], "d": {"e": {}}}, "😀 эмодзи", 0], "page": 1}',
+    ' \r\n{ "meta" : {"items": [9]} , "items" :[ {"x" : 1} ,{"x":2} ] ,"tail":"}]"}\n ',
+    '{"items": {"not": "array"}, "total": 1}',
+    '{"items": [[1, [2, [3]]], "[", "]", "{", "}", ",", ":", "\\"", ""]}',
+]
+
+
+def split_at(raw, offset):
+    return [raw[:offset], raw[offset:]]
+
+
+def expected(doc):
+    obj = json.loads(doc)
+    items = obj.pop('items') if isinstance(obj.get('items'), list) else []
+    return items, obj
+
+
+def decode(chunks):
+    meta = {}
+    items = list(iter_object_items(chunks, meta=meta))
+    return items, meta
+
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_every_split_offset_matches_json_loads(doc):
+    raw = doc.encode('utf-8')
+    for offset in range(len(raw) + 1):
+        assert decode(split_at(raw, offset)) == expected(doc), offset
+
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_single_byte_chunks_match_json_loads(doc):
+    raw = doc.encode('utf-8')
+    assert decode([raw[i:i + 1] for i in range(len(raw))]) == expected(doc)
+
+
+def test_long_page_in_small_chunks():
+    # Больше порога обрезки буфера: разобранное начало отрезается посреди страницы
+    items = [{"id": i, "name": f"Организация №{i}", "value": i * 0.5} for i in range(3000)]
+    raw = json.dumps({"items": items, "total": len(items)}, ensure_ascii=False).encode('utf-8')
+    assert decode([raw[i:i + 7] for i in range(0, len(raw), 7)]) == (items, {"total": len(items)})
+
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_truncated_body_raises(doc):
+    raw = doc.encode('utf-8')
+    end = len(raw.rstrip())
+    for length in range(end):
+        chunk = raw[:length]
+        # Обрыв посреди многобайтового символа — не повод для UnicodeDecodeError
+        if chunk.decode('utf-8', errors='ignore').encode('utf-8') != chunk:
+            continue
+        with pytest.raises(json.JSONDecodeError):
+            decode(split_at(chunk, length // 2))
+
+
+@pytest.mark.parametrize('doc', [
+    '{"items": [1,, 2]}',
+    '{"items": [1 2]}',
+    '{"items": [1, 2}',
+    '{"items": [tru]}',
+    '{"items": ["незакрытая]}',
+    '{items: []}',
+    '{"items": []',
+    '[1, 2]',
+    '',
+])
+def test_invalid_body_raises(doc):
+    raw = doc.encode('utf-8')
+    for offset in range(len(raw) + 1):
+        with pytest.raises(json.JSONDecodeError):
+            decode(split_at(raw, offset))
+
+
+def test_projector_keeps_only_requested_fields():
+    project = make_projector({"a": None, "b": {"c": None}})
+    assert project({"a": 1, "b": {"c": 2, "d": 3}, "e": 4}) == {"a": 1, "b": {"c": 2}}
+    assert project({"b": "не словарь"}) == {"b": "не словарь"}
+    assert project(5) == 5
+    assert make_projector(None)({"x": 1}) == {"x": 1}
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from scripts.load_to_sqlite import SqliteLoader, OFFENCE_FOUND, OFFENCE_NOT_FOUND
+
+
+def make_row(n, ogrn, result=OFFENCE_FOUND):
+    return {
+        "entity_name": f"Организация {ogrn or 'без ОГРН'}",
+        "ogrn": ogrn,
+        "purpose": f"Проверка {n}",
+        "status": "Завершено",
+        "result": result,
+        "examStartDate": "01.07.2025",
+        "external_id": f"id-{n}",
+    }
+
+
+@pytest.fixture
+def loader(tmp_path):
+    return SqliteLoader(db_name=str(tmp_path / 'inspections.db'))
+
+
+def org_rollup(loader):
+    conn = sqlite3.connect(loader.db_name)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            f'SELECT ogrn, total, offences, no_offences FROM {loader.org_rollup} ORDER BY ogrn')}
+    finally:
+        conn.close()
+
+
+def rebuilt_org_rollup(loader):
+    conn = sqlite3.connect(loader.db_name)
+    try:
+        loader.rebuild_rollups(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return org_rollup(loader)
+
+
+def test_rows_without_ogrn_are_not_an_organization(loader):
+    rows = [make_row(1, ''), make_row(2, ''), make_row(3, '1027700000001'),
+            make_row(4, '1027700000001', OFFENCE_NOT_FOUND), make_row(5, '')]
+    loader.upsert_batches([rows])
+
+    expected = {'1027700000001': (2, 1, 1)}
+    assert org_rollup(loader) == expected
+    assert rebuilt_org_rollup(loader) == expected
+
+
+def test_triggers_skip_empty_ogrn_on_update_and_delete(loader):
+    loader.upsert_batches([[make_row(1, ''), make_row(2, '1027700000001')]])
+    # Запись получила ОГРН, другая его потеряла
+    loader.upsert_batches([[make_row(1, '1027700000002'), make_row(2, '')]])
+    assert org_rollup(loader) == {'1027700000002': (1, 1, 0)}
+
+    # Полная выгрузка без первой записи удаляет её
+    loader.upsert_batches([[make_row(2, '')]])
+    assert org_rollup(loader) == {}
+    assert rebuilt_org_rollup(loader) == {}
+
+
+def test_legacy_triggers_are_replaced(loader):
+    loader.upsert_batches([[make_row(1, '1027700000001')]])
+    conn = sqlite3.connect(loader.db_name)
+    try:
+        # Триггер и сводка как в прежних версиях: пустой ОГРН — отдельная строка сводки
+        conn.execute(f'DROP TRIGGER {loader.storage_table}_rollup_ai')
+        conn.execute(f'CREATE TRIGGER {loader.storage_table}_rollup_ai AFTER INSERT ON {loader.storage_table} '
+                     f'BEGIN SELECT 1; END')
+        conn.execute(f"INSERT INTO {loader.org_rollup} VALUES ('', '', 5, 0, 0)")
+        conn.commit()
+    finally:
+        conn.close()
+
+    loader.upsert_batches([[make_row(1, '1027700000001'), make_row(2, '')]])
+    assert org_rollup(loader) == {'1027700000001': (1, 1, 0)}
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import signal
+import logging
+import asyncio
+from datetime import datetime, timezone, timedelta
+from apscheduler.schedulers.blocking import BlockingScheduler
+from scripts.headers_extractor import GosuslugiExtractor, CredentialCache
+from scripts.inspections_parser import ShardedInspectionsParser, stream_to_sqlite, create_http_session, plan_sync
+from scripts.load_to_sqlite import SqliteLoader
+from scripts.page_archive import PageArchiveWriter
+from scripts.metrics import ingest_registry
+from scripts.rate_limiter import AdaptiveRateLimiter
+from scripts.checkpoint import RunCheckpoint
+
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+# Константы
+DB_NAME = 'data/inspections.db'  # Та же БД, что читает веб-приложение (app.py)
+UPDATE_INTERVAL_MINUTES = 10  # Период автоматического обновления данных
+PARSER_WORKERS = 4  # Кол-во параллельных запросов страниц к API
+SYNC_DAYS = 31  # Глубина выгрузки по дате начала проверки
+SHARD_DAYS = None  # Начальный размер подокна выгрузки; None — всё окно (делится, только если не помещается в лимит API)
+FULL_RESYNC_HOURS = 24  # Как часто вместо инкрементальной синхронизации делать полную
+INCREMENTAL_OVERLAP_DAYS = 2  # Запас окна инкрементальной синхронизации назад от прошлого запуска
+ARCHIVE_DIR = None  # Каталог для архива сырых ответов API (например, 'data/archive'); None — не архивировать
+HEADERS_TTL = 60 * 60  # Сколько секунд переиспользовать перехваченные заголовки
+KEEP_BROWSER = False  # Держать Chromium запущенным между обновлениями (быстрее, но больше памяти)
+LIGHTWEIGHT_EXTRACTOR = True  # Не грузить в браузере картинки, шрифты, стили и трекеры
+RATE_LIMIT_INITIAL_RPS = 2.0  # Стартовый темп запросов к API, запросов/с
+RATE_LIMIT_MIN_RPS = 0.2  # Ниже этого темп не снижается даже при частых 429
+RATE_LIMIT_MAX_RPS = 10.0  # Потолок темпа, до которого он растёт при успешных ответах
+STREAM_JSON = True  # Разбирать страницы API потоково, по одному элементу (меньше пиковая память)
+CHECKPOINT_MAX_AGE_HOURS = 6  # Прерванный запуск продолжается, если начат не раньше; иначе — новый план
+
+# Общая keep-alive сессия для всех запусков планировщика
+http_session = create_http_session(pool_size=PARSER_WORKERS)
+
+# Ограничитель темпа живёт между запусками: подобранный темп не приходится искать заново
+rate_limiter = AdaptiveRateLimiter(initial_rate=RATE_LIMIT_INITIAL_RPS, min_rate=RATE_LIMIT_MIN_RPS,
+                                   max_rate=RATE_LIMIT_MAX_RPS)
+
+# Заголовки API кэшируются между запусками — браузер стартует только при их устаревании
+credentials = CredentialCache(GosuslugiExtractor(
+    headless=True, keep_browser=KEEP_BROWSER, lightweight=LIGHTWEIGHT_EXTRACTOR
+), ttl=HEADERS_TTL)
+
+# Постоянный event loop для задачи обновления: объекты Playwright привязаны к циклу,
+# в котором созданы, поэтому тёплый браузер живёт только в одном и том же цикле
+job_loop = asyncio.new_event_loop()
+
+
+async def update_data_job():
+    logger.info('[SCHEDULER] Запуск функции update_data_job (диагностика)')
+    # Итог запуска со срезом метрик сохраняется в ingest_runs — его отдаёт /metrics веб-приложения
+    ingest_registry.reset()
+    run = {"started_at": datetime.now(timezone.utc).isoformat(), "status": "error", "items": 0, "mode": None}
+    started = time.perf_counter()
+    loader = SqliteLoader(db_name=DB_NAME)
+    try:
+        logger.info('[SCHEDULER] Запуск автоматического обновления данных...')
+        state = loader.get_sync_state()
+        # Прерванный запуск продолжаем с тем же планом (окном), иначе запрашивались бы другие страницы
+        checkpoint = RunCheckpoint.resume(DB_NAME, max_age=timedelta(hours=CHECKPOINT_MAX_AGE_HOURS))
+        if checkpoint is not None:
+            plan = checkpoint.plan
+            logger.info(f"[SCHEDULER] Продолжаем прерванный запуск {checkpoint.run_id} от {checkpoint.started_at} "
+                        f"(записано страниц: {checkpoint.resumed_pages}, подокон: "
+                        f"{sum(done for _, done in checkpoint.pages.values())})")
+        else:
+            plan = plan_sync(state, datetime.now(timezone.utc), sync_days=SYNC_DAYS,
+                             full_resync_hours=FULL_RESYNC_HOURS, overlap_days=INCREMENTAL_OVERLAP_DAYS)
+            checkpoint = RunCheckpoint.start(DB_NAME, plan)
+        logger.info(f"[SCHEDULER] Режим синхронизации: {'полная' if plan['full'] else 'инкрементальная'}, "
+                    f"окно с {plan['start']:%Y-%m-%d %H:%M}")
+        run["mode"] = 'full' if plan['full'] else 'incremental'
+        for attempt in range(2):
+            headers = await credentials.get_headers()
+            if not headers:
+                logger.warning('[SCHEDULER] Не удалось получить заголовки для обновления данных.')
+                run["status"] = 'no_headers'
+                return
+            archive = None
+            if ARCHIVE_DIR:
+                archive_name = f"{plan['end']:%Y%m%dT%H%M%S}{'-full' if plan['full'] else ''}.ndjson.gz"
+                archive = PageArchiveWriter(os.path.join(ARCHIVE_DIR, archive_name))
+            parser = ShardedInspectionsParser(
+                headers=headers, start=plan["start"], end=plan["end"], shard_days=SHARD_DAYS,
+                max_workers=PARSER_WORKERS, session=http_session, rate_limiter=rate_limiter,
+                checkpoint=checkpoint, changed_since=plan["changed_since"], archive=archive,
+                stream_json=STREAM_JSON, as_tuples=True
+            )
+            try:
+                # Отсутствующие записи удаляем только после полной и завершённой выгрузки
+                total = stream_to_sqlite(parser.iter_batches(), db_path=DB_NAME, mode='upsert',
+                                         is_complete=lambda: plan["full"] and parser.completed,
+                                         run_id=checkpoint.run_id)
+            finally:
+                if archive is not None:
+                    archive.close()
+            if not parser.auth_failed:
+                break
+            # Сессия протухла раньше TTL — сбрасываем кэш и пробуем один раз с новыми заголовками
+            logger.warning('[SCHEDULER] Заголовки отклонены API, получаем новые...')
+            credentials.invalidate()
+        run["items"] = total
+        run["status"] = 'ok' if parser.completed else 'auth_failed' if parser.auth_failed else 'incomplete'
+        # Сюда доходим, только если загрузка не упала (stream_to_sqlite пробрасывает ошибки записи)
+        if parser.completed:
+            # Отметку сдвигаем только после успешной выгрузки, иначе следующий запуск повторит окно
+            loader.save_sync_state({
+                "last_sync_at": plan["end"].isoformat(),
+                "last_full_sync_at": plan["end"].isoformat() if plan["full"] else state.get("last_full_sync_at"),
+                "last_edit_ts": parser.max_last_edit or state.get("last_edit_ts"),
+            })
+            # Контрольные точки сбрасываем последними: при сбое раньше запуск продолжится с них
+            checkpoint.finish()
+        if total:
+            # Загрузчик увеличил версию в dataset_meta — веб-приложение подхватит её само
+            logger.info(f'[SCHEDULER] Данные успешно обновлены ({total} записей).')
+        else:
+            logger.warning('[SCHEDULER] Нет новых данных для обновления.')
+    except Exception as e:
+        logger.error(f'[SCHEDULER] Ошибка при обновлении данных: {e}')
+    finally:
+        run["finished_at"] = datetime.now(timezone.utc).isoformat()
+        run["duration_sec"] = time.perf_counter() - started
+        run["metrics"] = ingest_registry.snapshot()
+        try:
+            loader.save_run(run)
+        except Exception as e:
+            logger.error(f'[SCHEDULER] Не удалось сохранить итог запуска: {e}')
+        logger.info(f"[SCHEDULER] Итог запуска: {run['status']}, записей {run['items']}, "
+                    f"{run['duration_sec']:.1f} сек")
+
+
+def run_update_job():
+    job_loop.run_until_complete(update_data_job())
+
+
+def run_worker():
+    """
+    Процесс загрузки данных: первое обновление сразу при старте, затем каждые
+    UPDATE_INTERVAL_MINUTES минут. С веб-приложением общается только через БД:
+    после загрузки меняется версия в dataset_meta.
+    """
+    SqliteLoader(db_name=DB_NAME).ensure_schema()
+    # Веб-сервер останавливает встроенный воркер через SIGTERM — завершаемся как по Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    scheduler = BlockingScheduler()
+    # coalesce/max_instances: пропущенные из-за долгой загрузки запуски не накапливаются
+    scheduler.add_job(run_update_job, 'interval', minutes=UPDATE_INTERVAL_MINUTES,
+                      next_run_time=datetime.now(), coalesce=True, max_instances=1)
+    logger.info(f'[SCHEDULER] Воркер загрузки запущен, обновление каждые {UPDATE_INTERVAL_MINUTES} мин.')
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        job_loop.run_until_complete(credentials.close())
+
+
+# Для запуска из терминала отдельно от веб-сервера
+if __name__ == "__main__":
+    run_worker()